@@ -10,7 +10,8 @@ import re
 from copy import deepcopy
 
 import pyparsing
-from six import string_types, integer_types
+from six import string_types, integer_types, get_unbound_function
+from six.moves import intern
 
 from .errors import CompilationError, GrammarError
 from . import references
@@ -20,6 +21,59 @@ class TraversalOrder(object):
     PreOrder, PostOrder = list(range(2))
 
 
+def _invalid_order_error():
+    return ValueError("order should be either %d for pre-order or %d for "
+                      "post-order" % (TraversalOrder.PreOrder,
+                                      TraversalOrder.PostOrder))
+
+
+def _iter_expansion(e, order=TraversalOrder.PreOrder, shallow=False):
+    """
+    Generator function yielding each expansion in an expansion tree in the
+    specified order.
+
+    This uses an explicit stack rather than recursion, so it isn't limited by the
+    recursion depth and callers can stop traversing the tree early.
+
+    :param e: Expansion
+    :param order: int
+    :param shallow: whether to not process trees of referenced rules (default False)
+    :returns: generator
+    """
+    def get_children(x):
+        if isinstance(x, NamedRuleRef) and not shallow:
+            # Use the referenced rule's tree.
+            return [x.referenced_rule.expansion]
+        else:
+            return list(x.children)
+
+    if order == TraversalOrder.PreOrder:
+        stack = [e]
+        while stack:
+            x = stack.pop()
+            yield x
+
+            # Get the children after x has been processed, in case they changed.
+            children = get_children(x)
+            children.reverse()
+            stack.extend(children)
+    elif order == TraversalOrder.PostOrder:
+        # The stack contains expansions and whether their children have been
+        # added to it.
+        stack = [(e, False)]
+        while stack:
+            x, children_added = stack.pop()
+            if children_added:
+                yield x
+            else:
+                stack.append((x, True))
+                children = get_children(x)
+                children.reverse()
+                stack.extend([(c, False) for c in children])
+    else:
+        raise _invalid_order_error()
+
+
 def map_expansion(e, func=lambda x: x, order=TraversalOrder.PreOrder,
                   shallow=False):
     """
@@ -44,9 +98,7 @@ def map_expansion(e, func=lambda x: x, order=TraversalOrder.PreOrder,
     elif order == TraversalOrder.PostOrder:
         return map_children(e), func(e)
     else:
-        raise ValueError("order should be either %d for pre-order or %d for "
-                         "post-order" % (TraversalOrder.PreOrder,
-                                         TraversalOrder.PostOrder))
+        raise _invalid_order_error()
 
 
 def find_expansion(e, func=lambda x: x, order=TraversalOrder.PreOrder,
@@ -64,33 +116,9 @@ def find_expansion(e, func=lambda x: x, order=TraversalOrder.PreOrder,
     :param shallow: whether to not process trees of referenced rules (default False)
     :returns: Expansion | None
     """
-    def find_in_children(x):
-        # Find in the referenced rule's tree
-        if isinstance(x, NamedRuleRef) and not shallow:
-            return find_expansion(x.referenced_rule.expansion, func, order, shallow)
-        else:
-            for child in x.children:
-                child_result = find_expansion(child, func, order, shallow)
-                if child_result:
-                    return child_result
-
-    if order == TraversalOrder.PreOrder:
-        # Check e first, then the children if func(e) is None.
-        if func(e):
-            return e
-        else:
-            return find_in_children(e)
-    elif order == TraversalOrder.PostOrder:
-        # Check children first, then e if find_in_children returns None.
-        result = find_in_children(e)
-        if result:
-            return result
-        elif func(e):
-            return e
-    else:
-        raise ValueError("order should be either %d for pre-order or %d for "
-                         "post-order" % (TraversalOrder.PreOrder,
-                                         TraversalOrder.PostOrder))
+    for x in _iter_expansion(e, order, shallow):
+        if func(x):
+            return x
 
 
 def flat_map_expansion(e, func=lambda x: x, order=TraversalOrder.PreOrder,
@@ -104,14 +132,7 @@ def flat_map_expansion(e, func=lambda x: x, order=TraversalOrder.PreOrder,
     :param shallow: whether to not process trees of referenced rules (default False)
     :returns: list
     """
-    result = []
-
-    def flatten(x):
-        result.append(func(x))
-
-    map_expansion(e, flatten, order, shallow)
-
-    return result
+    return [func(x) for x in _iter_expansion(e, order, shallow)]
 
 
 def filter_expansion(e, func=lambda x: x, order=TraversalOrder.PreOrder,
@@ -125,15 +146,7 @@ def filter_expansion(e, func=lambda x: x, order=TraversalOrder.PreOrder,
     :param shallow: whether to not process trees of referenced rules (default False)
     :returns: list
     """
-    result = []
-
-    def filter_(x):
-        if func(x):
-            result.append(x)
-
-    map_expansion(e, filter_, order, shallow)
-
-    return result
+    return [x for x in _iter_expansion(e, order, shallow) if func(x)]
 
 
 def save_current_matches(e):
@@ -147,13 +160,11 @@ def save_current_matches(e):
     :returns: dict
     """
     values = {}
-
-    def save(x):
+    for x in _iter_expansion(e):
         values[x] = {
             "current_match": x.current_match,
             "matching_slice": x.matching_slice,
         }
-    map_expansion(e, save)
     return values
 
 
@@ -165,7 +176,7 @@ def restore_current_matches(e, values, override_none=True):
     :param values: dict
     :param override_none: bool
     """
-    def restore(x):
+    for x in _iter_expansion(e):
         match_data = values.get(x, None)
         if match_data:
             if not override_none and match_data["current_match"] is not None:
@@ -173,7 +184,45 @@ def restore_current_matches(e, values, override_none=True):
             if not override_none and match_data["matching_slice"] is not None:
                 x.matching_slice = match_data["matching_slice"]
 
-    map_expansion(e, restore)
+
+def _compile_expansion(e):
+    # Return the compiled string of an expansion, compiling it only if it has
+    # changed since it was last compiled. The stored string is cleared along with
+    # cached hash values, which depend on the same members.
+    result = e._compiled_cache
+    if result is None:
+        result = e.compile()
+        e._compiled_cache = result
+    return result
+
+
+def _get_state(obj):
+    # Return a dictionary of an object's attributes for pickling, including those
+    # stored in __slots__ and, for sub-classes without __slots__, in __dict__.
+    state = {}
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get("__slots__", ()):
+            if hasattr(obj, name):
+                state[name] = getattr(obj, name)
+    state.update(getattr(obj, "__dict__", {}))
+    return state
+
+
+def _set_state(obj, state):
+    # Restore attributes returned by _get_state().
+    for name, value in state.items():
+        setattr(obj, name, value)
+
+
+def _deepcopy_expansion(e, memo):
+    # Equivalent of copy.deepcopy(e, memo) for expansions that calls __deepcopy__
+    # directly, skipping the generic dispatch. Expansions in memo are used as
+    # their own copies, which allows substituting subtrees.
+    result = memo.get(id(e))
+    if result is None:
+        result = e.__deepcopy__(memo)
+        memo[id(e)] = result
+    return result
 
 
 def matches_overlap(m1, m2):
@@ -206,6 +255,7 @@ class JointTreeContext(object):
 
     This class can be used with Python's ``with`` statement.
     """
+    __slots__ = ("_root",)
 
     def __init__(self, root_expansion):
         self._root = root_expansion
@@ -235,10 +285,12 @@ class JointTreeContext(object):
             x.referenced_rule.expansion.parent = None
 
     def __enter__(self):
-        map_expansion(self._root, self.join_tree, TraversalOrder.PostOrder)
+        for x in _iter_expansion(self._root, TraversalOrder.PostOrder):
+            self.join_tree(x)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        map_expansion(self._root, self.detach_tree, TraversalOrder.PostOrder)
+        for x in _iter_expansion(self._root, TraversalOrder.PostOrder):
+            self.detach_tree(x)
 
 
 @functools.total_ordering
@@ -249,6 +301,7 @@ class ChildList(object):
     The ``parent`` attribute of each child will be set appropriately when they
     added or removed from lists.
     """
+    __slots__ = ("_expansion", "_list")
 
     def __init__(self, expansion, seq=()):
         # Ensure that 'expansion' is an expansion.
@@ -267,6 +320,12 @@ class ChildList(object):
         # Use an internal list rather than sub-classing to avoid pickling issues.
         self._list = list(seq)
 
+    def __getstate__(self):
+        return _get_state(self)
+
+    def __setstate__(self, state):
+        _set_state(self, state)
+
     def __repr__(self):
         return repr(self._list)
 
@@ -288,10 +347,20 @@ class ChildList(object):
     def __iadd__(self, other):
         self._list += other
 
+    def _adopt(self, e):
+        # Set the parent of an expansion added to this list. If the expansion is
+        # already a child, setting the parent won't invalidate anything, so do it
+        # here because the list has still changed.
+        if e.parent is self._expansion:
+            self._expansion.invalidate_matcher()
+            self._expansion._invalidate_tree_caches()
+        else:
+            e.parent = self._expansion
+
     def append(self, e):
         e = Expansion.make_expansion(e)
         self._list.append(e)
-        e.parent = self._expansion
+        self._adopt(e)
 
     def __iter__(self):
         return iter(self._list)
@@ -317,7 +386,7 @@ class ChildList(object):
 
         # Set the parent of each to self._expansion.
         for e in iterable:
-            e.parent = self._expansion
+            self._adopt(e)
 
         # Call the super method to extend the list.
         self._list.extend(iterable)
@@ -331,7 +400,7 @@ class ChildList(object):
         # Make e an Expansion, call the super method and set e's parent.
         e = Expansion.make_expansion(e)
         self._list.insert(index, e)
-        e.parent = self._expansion
+        self._adopt(e)
 
     def pop(self, index=-1):
         # Pop item at the specified index (default -1), set its parent to None
@@ -367,10 +436,7 @@ class ChildList(object):
         self._list[slice(i, j)] = sequence
 
         # Adopt the new children :-)
-        def adopt(x):
-            x.parent = self._expansion
-
-        [adopt(c) for c in sequence]
+        [self._adopt(c) for c in sequence]
 
     def __getitem__(self, key):
         return self._list[key]
@@ -399,14 +465,30 @@ class Expansion(object):
     Expansion base class.
     """
 
+    __slots__ = ("_tag", "_parent", "_matcher_element", "_matcher_expansions",
+                 "_matcher_resets", "_hash_cache", "_compiled_cache", "_children",
+                 "_current_match", "_matching_slice", "rule", "_lookup_dict")
+
     _NO_CALCULATION = object()
 
+    # Maximum number of calculations stored in each of the root expansion's lookup
+    # dictionaries.
+    _MAX_STORED_CALCULATIONS = 10000
+
     def __init__(self, children):
         self._tag = None
         self._parent = None
 
-        # Internal member for the parser element used during matching.
+        # Internal members for the parser element used during matching, the list
+        # of expansions it sets match data for and the values used to reset them.
         self._matcher_element = None
+        self._matcher_expansions = None
+        self._matcher_resets = None
+
+        # Internal members used for caching this expansion's hash value and
+        # compiled string.
+        self._hash_cache = None
+        self._compiled_cache = None
 
         # Set children, letting the setter handle validation.
         self._children = None
@@ -425,6 +507,17 @@ class Expansion(object):
         return self + other
 
     def __hash__(self):
+        # Return the cached hash value if there is one.
+        result = self._hash_cache
+        if result is None:
+            result = self._calculate_hash()
+
+            # Cache the hash value if it doesn't depend on ancestors.
+            if self._can_cache_hash():
+                self._hash_cache = result
+        return result
+
+    def _calculate_hash(self):
         # The hash of an expansion is a combination of the class name, tag and
         # hashes of children, similar to expansion string representations.
         child_hashes = [hash(c) for c in self.children]
@@ -432,6 +525,33 @@ class Expansion(object):
             "%s(%s)%s" % (self.__class__.__name__, child_hashes, self.tag)
         )
 
+    def _can_cache_hash(self):
+        # Whether the hash value calculated by _calculate_hash() can be cached.
+        # This is not the case if a child's hash value could not be cached, e.g.
+        # if a Dictation expansion is a descendant.
+        return all(c._hash_cache is not None for c in self.children)
+
+    def _invalidate_hash(self):
+        # Clear the cached hash values and compiled strings of this expansion and
+        # each ancestor, as their values depend on this one.
+        e = self
+        while e:
+            e._hash_cache = None
+            e._compiled_cache = None
+            e = e._parent
+
+    def _invalidate_tree_caches(self):
+        # Clear the cached hash values and compiled strings of this expansion and
+        # each ancestor, and the calculations stored in the root expansion, because
+        # the tree has changed.
+        e = root = self
+        while e:
+            e._hash_cache = None
+            e._compiled_cache = None
+            root = e
+            e = e._parent
+        root._lookup_dict = None
+
     def __copy__(self):
         if not self.children:
             e = type(self)([])
@@ -444,7 +564,7 @@ class Expansion(object):
         if not self.children:
             e = type(self)([])
         else:
-            children = [deepcopy(child, memo) for child in self.children]
+            children = [_deepcopy_expansion(child, memo) for child in self.children]
             e = type(self)(children)
         e.tag = self.tag
         return e
@@ -484,6 +604,17 @@ class Expansion(object):
         self._children = ChildList(self, value)
 
     def compile(self):
+        """
+        Compile this expansion and return the result.
+
+        Compiled strings are stored and reused by the compile methods of parent
+        expansions and rules until this expansion or one of its descendants is
+        changed through the children list, the ``tag`` property or the setters
+        of sub-classes. Sub-classes whose output depends on other attributes
+        should call ``_invalidate_hash`` when those attributes change.
+
+        :returns: str
+        """
         self.validate_compilable()
         return self.compiled_tag
 
@@ -505,19 +636,26 @@ class Expansion(object):
 
     @parent.setter
     def parent(self, value):
-        if isinstance(value, Expansion) or value is None:
+        if value is self._parent:
+            # Nothing has changed, so there is nothing to invalidate.
+            return
+        elif isinstance(value, Expansion) or value is None:
             # Invalidate the old parent if necessary.
             if self._parent:
                 self._parent.invalidate_matcher()
+                self._parent._invalidate_tree_caches()
 
-            # Set the parent and invalidate the matcher element for this expansion.
+            # Set the parent and invalidate the matcher element and any stored
+            # calculations for this expansion.
             self._parent = value
             self.invalidate_matcher()
+            self._lookup_dict = None
 
             # Also invalidate the new parent as necessary. This is a quick operation
             # if nothing has been matched yet.
             if self._parent:
                 self._parent.invalidate_matcher()
+                self._parent._invalidate_tree_caches()
         else:
             raise TypeError("'parent' must be an Expansion or None")
 
@@ -546,6 +684,9 @@ class Expansion(object):
         else:
             raise TypeError("expected JSGF tag string, got %s instead" % value)
 
+        # Discard stored calculations as well because some depend on tags.
+        self._invalidate_tree_caches()
+
     @property
     def compiled_tag(self):
         """
@@ -606,13 +747,16 @@ class Expansion(object):
 
     @current_match.setter
     def current_match(self, value):
+        if isinstance(value, string_types):
+            # Ensure that string values have only one space between words.
+            # str.split() already strips whitespace from each word.
+            value = " ".join(value.split())
         self._set_current_match(value)
 
     def _set_current_match(self, value):
-        if isinstance(value, string_types):
-            # Ensure that string values have only one space between words
-            value = " ".join([x.strip() for x in value.split()])
-        elif value is not None:
+        # Set the current match value. String values should already have only one
+        # space between words.
+        if not isinstance(value, string_types) and value is not None:
             raise TypeError("current_match must be a string or None")
 
         if not value:
@@ -628,6 +772,11 @@ class Expansion(object):
         """
         Slice of the last speech string matched. This will be ``None`` initially.
 
+        Speech strings are matched with one space between words, so the slice
+        indexes the speech string normalised that way rather than the string
+        passed to :meth:`matches`. For example, matching ``"  hello   world"``
+        gives ``world`` a slice of ``slice(6, 11)``.
+
         :rtype: slice
         """
         return self._matching_slice
@@ -643,7 +792,56 @@ class Expansion(object):
         """
         Call ``reset_match_data`` for this expansion and all of its descendants.
         """
-        map_expansion(self, lambda x: x.reset_match_data())
+        resets = self._get_matcher_resets()
+        if resets is None:
+            for x in self._get_matcher_expansions():
+                x.reset_match_data()
+            return
+
+        # Set the precomputed values for expansions that use the default
+        # reset_match_data() method, then call the method for the others.
+        values, others = resets
+        for x, value in values:
+            x._current_match = value
+            x._matching_slice = None
+        for x in others:
+            x.reset_match_data()
+
+    def _get_matcher_resets(self):
+        # Return a list of (expansion, unmatched current_match value) pairs for
+        # expansions using the default reset_match_data() method and a list of
+        # the other expansions, or None if they cannot be stored.
+        # Unmatched values depend on ancestors via is_optional, so they are only
+        # stored for root expansions, which are invalidated if they get a parent.
+        resets = self._matcher_resets
+        if resets is not None or self._parent or not self._matcher_element:
+            return resets
+
+        default_reset = get_unbound_function(Expansion.reset_match_data)
+        default_set = get_unbound_function(Expansion._set_current_match)
+        values, others = [], []
+        for x in self._get_matcher_expansions():
+            t = type(x)
+            if (get_unbound_function(t.reset_match_data) is default_reset and
+                    get_unbound_function(t._set_current_match) is default_set):
+                values.append((x, "" if x.is_optional else None))
+            else:
+                others.append(x)
+
+        resets = (values, others)
+        self._matcher_resets = resets
+        return resets
+
+    def _get_matcher_expansions(self):
+        # Return a list of this expansion and its descendants, including those in
+        # referenced rules, in pre-order. The list is only stored if the matcher
+        # element has been initialised because it is discarded along with it.
+        expansions = self._matcher_expansions
+        if expansions is None:
+            expansions = list(_iter_expansion(self))
+            if self._matcher_element:
+                self._matcher_expansions = expansions
+        return expansions
 
     def reset_match_data(self):
         """
@@ -667,11 +865,20 @@ class Expansion(object):
 
             <rule> = [test] test;
 
+        Leading, trailing and repeated whitespace in ``speech`` and in ``Literal``
+        text is ignored: speech is split into words and matched with one space
+        between them. The returned remainder, ``current_match`` values and
+        ``matching_slice`` values all refer to the speech string normalised this
+        way.
+
         :param speech: str
         :returns: str
         """
+        # Split speech into words once so that the matched tokens don't need to be
+        # normalised again by each parse action.
+        speech = " ".join(speech.split())
+
         # Match the string using this expansion's parser element.
-        speech = speech.strip()
         try:
             result = " ".join(
                 self.matcher_element.parseString(speech).asList()
@@ -684,14 +891,13 @@ class Expansion(object):
         remaining = speech[len(result):].strip()
 
         # Do a second pass of the expansion tree for post-processing.
-        def process(x):
+        for x in self._get_matcher_expansions():
             # Remove partial matches.
             if (x.parent and not isinstance(x, NamedRuleRef) and not
                     x.parent.current_match):
                 x.current_match = None
                 x.matching_slice = None
 
-        map_expansion(self, process)
         return remaining
 
     def invalidate_matcher(self):
@@ -710,6 +916,8 @@ class Expansion(object):
         # Set _matcher_element to None for this expansion and each ancestor, but not
         # any other subtrees (they are unaffected).
         self._matcher_element = None
+        self._matcher_expansions = None
+        self._matcher_resets = None
         if self.parent:
             self.parent.invalidate_matcher()
 
@@ -717,14 +925,12 @@ class Expansion(object):
         # NamedRuleRefs that reference this rule. To make things simple, this is
         # is only done if this expansion belongs to a rule in a grammar.
         elif self.rule and self.rule.grammar:
-            def process(x):
-                if isinstance(x, NamedRuleRef) and x.name == self.rule.name:
-                    x.invalidate_matcher()
-
             # Invalidate each reference to this rule. Use shallow=True because every
             # rule in the grammar will be processed, no need to process rules twice.
             for r in self.rule.grammar.rules:
-                map_expansion(r.expansion, process, shallow=True)
+                for x in _iter_expansion(r.expansion, shallow=True):
+                    if isinstance(x, NamedRuleRef) and x.name == self.rule.name:
+                        x.invalidate_matcher()
 
     @property
     def matcher_element(self):
@@ -742,7 +948,9 @@ class Expansion(object):
         return element
 
     def _parse_action(self, tokens):
-        self.current_match = " ".join(tokens.asList())
+        # Matched tokens are single words or Literal text with one space between
+        # words, so the current_match setter's normalisation isn't required.
+        self._set_current_match(" ".join(tokens.asList()))
         return tokens
 
     def _make_matcher_element(self):
@@ -828,12 +1036,24 @@ class Expansion(object):
         else:
             id_key = id(key)
 
+        # Add a dictionary for calculations without one, e.g. those made in
+        # extension modules.
+        lookup = root._lookup_dict.get(name)
+        if lookup is None:
+            lookup = {}
+            root._lookup_dict[name] = lookup
+
         if value is self._NO_CALCULATION:
             # Drop the stored value, if there is one.
-            root._lookup_dict[name].pop(id_key, None)
+            lookup.pop(id_key, None)
         else:
             # Otherwise store 'value' under the 'name' dictionary using 'id_key'.
-            root._lookup_dict[name][id_key] = value
+            # Evict one entry first if the dictionary is full so that memory use
+            # stays bounded for large expansion trees.
+            if (id_key not in lookup and
+                    len(lookup) >= self._MAX_STORED_CALCULATIONS):
+                lookup.pop(next(iter(lookup)))
+            lookup[id_key] = value
 
     def _lookup_calculation(self, name, key):
         # Check if a calculation has already been made and return it. If no
@@ -860,7 +1080,25 @@ class Expansion(object):
 
         # Return the value from the relevant dictionary or _NO_CALCULATION if it
         # hasn't been calculated yet.
-        return root._lookup_dict[name].get(id_key, self._NO_CALCULATION)
+        lookup = root._lookup_dict.get(name)
+        if lookup is None:
+            return self._NO_CALCULATION
+        return lookup.get(id_key, self._NO_CALCULATION)
+
+    def _references_rules(self):
+        # Check whether this expansion or any of its descendants reference other
+        # rules. Calculations over trees that do can't be stored, as changes to
+        # referenced rules don't discard them. The check itself only depends on
+        # this expansion tree, so its result is stored to avoid scanning the tree
+        # again on later calls.
+        calc_name = "references_in_expansion"
+        result = self._lookup_calculation(calc_name, self)
+        if result is self._NO_CALCULATION:
+            result = bool(find_expansion(
+                self, lambda x: isinstance(x, NamedRuleRef), shallow=True
+            ))
+            self._store_calculation(calc_name, self, result)
+        return result
 
     def invalidate_calculations(self):
         """
@@ -869,8 +1107,9 @@ class Expansion(object):
         ``is_descendant_of``, neither of which are used in compiling or matching
         rules.
 
-        This should be called if a child is added to an expansion or if an
-        expansion's parent is changed outside of what ``JointTreeContext`` does.
+        Stored calculations are discarded automatically if an expansion's parent is
+        changed, so this only needs to be called if the result of one of these
+        calculations may have changed in another way.
 
         Some changes may also require invalidating descendants, the
         ``map_expansion`` function can be used with this method to accomplish that::
@@ -881,14 +1120,12 @@ class Expansion(object):
         if not root._lookup_dict:
             return  # nothing to invalidate
 
+        # Calculations are stored using expansion IDs.
+        self_id = id(self)
         for d in root._lookup_dict.values():
-            for k, v in d.items():
-                # Assume k is either an expansion or an iterable of expansions
-                if self is k or isinstance(k, (tuple, list)) and self in k:
-                    assert isinstance(d, dict)
-                    d.pop(k)
-                # Do something similar for values
-                elif self is v or isinstance(v, (tuple, list)) and self in k:
+            for k in list(d.keys()):
+                # Assume k is either an expansion ID or a tuple of expansion IDs.
+                if self_id == k or isinstance(k, tuple) and self_id in k:
                     d.pop(k)
 
     def __str__(self):
@@ -908,13 +1145,25 @@ class Expansion(object):
         return not self.__eq__(other)
 
     def __contains__(self, item):
-        return item in flat_map_expansion(self)
+        return item in _iter_expansion(self)
 
     def __getstate__(self):
-        state = self.__dict__.copy()
+        state = _get_state(self)
         state['_matcher_element'] = None
+        state['_matcher_expansions'] = None
+        state['_matcher_resets'] = None
+
+        # String hash values can differ between Python processes, so don't keep the
+        # cached value.
+        state['_hash_cache'] = None
+
+        # Stored calculations use object IDs, which won't be the same afterwards.
+        state['_lookup_dict'] = None
         return state
 
+    def __setstate__(self, state):
+        _set_state(self, state)
+
     @property
     def is_optional(self):
         """
@@ -922,10 +1171,15 @@ class Expansion(object):
 
         :returns: bool
         """
-        result = False
-        if self.parent:
-            result = self.parent.is_optional
-        return result
+        # Walk up the tree to the first ancestor with its own is_optional property.
+        # This is equivalent to using the parent's value recursively, but is
+        # faster because this property is checked very often during matching.
+        p = self._parent
+        while p is not None:
+            if type(p).is_optional is not Expansion.is_optional:
+                return p.is_optional
+            p = p._parent
+        return False
 
     @property
     def is_alternative(self):
@@ -1046,19 +1300,23 @@ class Expansion(object):
 
         calc_name = "mutually_exclusive_of"
 
-        # Check if this has been calculated before. Check (other, self) too; mutual
-        # exclusivity is commutative.
-        calc = self._lookup_calculation(calc_name, (self, other))
-        if calc is self._NO_CALCULATION:
-            calc = self._lookup_calculation(calc_name, (other, self))
+        def get_key(e1, e2):
+            # Mutual exclusivity is commutative, so order each pair by ID. This way
+            # calculations only need to be stored and looked up once.
+            if id(e1) < id(e2):
+                return e1, e2
+            else:
+                return e2, e1
 
+        # Check if this has been calculated before.
+        calc = root._lookup_calculation(calc_name, get_key(self, other))
         if calc is not self._NO_CALCULATION:
             return calc
 
         def add_leaf(x):
             if not x.children:
-                self._store_calculation(calc_name, (x, self), True)
-                self._store_calculation(calc_name, (x, other), True)
+                root._store_calculation(calc_name, get_key(x, self), True)
+                root._store_calculation(calc_name, get_key(x, other), True)
 
         def valid_alt_set(x):
             if isinstance(x, AlternativeSet) and len(x.children) > 1:
@@ -1084,14 +1342,15 @@ class Expansion(object):
                     # mutually exclusive to self and other
                     for child in filter(lambda c: c is not e1 and c is not e2,
                                         x.children):
-                        map_expansion(child, add_leaf, shallow=True)
+                        for leaf in _iter_expansion(child, shallow=True):
+                            add_leaf(leaf)
 
                 return valid
 
         # Calculate mutually exclusivity, cache the calculation in root._lookup_dict
         # and return the result.
         result = bool(find_expansion(root, valid_alt_set))
-        root._store_calculation(calc_name, (self, other), result)
+        root._store_calculation(calc_name, get_key(self, other), result)
         return result
 
 
@@ -1099,10 +1358,27 @@ class BaseExpansionRef(references.BaseRef, Expansion):
     """
     Base class which RuleRef, NamedRuleRef, NullRef and VoidRef inherit from.
     """
+    __slots__ = ("_name",)
+
     def __init__(self, name):
-        # Call both super constructors
-        references.BaseRef.__init__(self, name)
+        # Call both super constructors. Expansion's constructor is called first so
+        # that the name setter can invalidate the hash value.
         Expansion.__init__(self, [])
+        references.BaseRef.__init__(self, name)
+
+    @property
+    def name(self):
+        """
+        The referenced name.
+
+        :returns: str
+        """
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        references.BaseRef.name.fset(self, value)
+        self._invalidate_hash()
 
     @staticmethod
     def valid(name):
@@ -1116,6 +1392,10 @@ class BaseExpansionRef(references.BaseRef, Expansion):
         return "%s('%s')" % (self.__class__.__name__, self.name)
 
     def __hash__(self):
+        # Use Expansion.__hash__ rather than BaseRef.__hash__.
+        return Expansion.__hash__(self)
+
+    def _calculate_hash(self):
         return hash("%s" % self)
 
     def __eq__(self, other):
@@ -1135,6 +1415,8 @@ class NamedRuleRef(BaseExpansionRef):
     """
     Class used to reference rules by name.
     """
+    __slots__ = ()
+
     @property
     def referenced_rule(self):
         """
@@ -1177,6 +1459,8 @@ class NullRef(BaseExpansionRef):
     The *NULL* rule always matches speech. If this reference is used by
     a rule, that part of the rule expansion requires no speech substring to match.
     """
+    __slots__ = ()
+
     def __init__(self):
         super(NullRef, self).__init__("NULL")
 
@@ -1206,6 +1490,8 @@ class VoidRef(BaseExpansionRef):
     The *VOID* rule can never be spoken. If this reference is used by a rule, then
     it will not match unless the reference it is optional.
     """
+    __slots__ = ()
+
     def __init__(self):
         super(VoidRef, self).__init__("VOID")
 
@@ -1229,6 +1515,7 @@ class VoidRef(BaseExpansionRef):
 
 
 class ExpansionWithChildren(Expansion):
+    __slots__ = ()
 
     def validate_compilable(self):
         super(ExpansionWithChildren, self).validate_compilable()
@@ -1240,6 +1527,8 @@ class ExpansionWithChildren(Expansion):
 
 
 class SingleChildExpansion(ExpansionWithChildren):
+    __slots__ = ()
+
     def __init__(self, expansion):
         super(SingleChildExpansion, self).__init__([expansion])
 
@@ -1263,12 +1552,14 @@ class SingleChildExpansion(ExpansionWithChildren):
         return e
 
     def __deepcopy__(self, memo):
-        e = type(self)(deepcopy(self.child, memo))
+        e = type(self)(_deepcopy_expansion(self.child, memo))
         e.tag = self.tag
         return e
 
 
 class VariableChildExpansion(ExpansionWithChildren):
+    __slots__ = ()
+
     def __init__(self, *expansions):
         super(VariableChildExpansion, self).__init__(expansions)
         
@@ -1290,7 +1581,7 @@ class VariableChildExpansion(ExpansionWithChildren):
         if not self.children:
             e = type(self)()
         else:
-            children = [deepcopy(child, memo) for child in self.children]
+            children = [_deepcopy_expansion(child, memo) for child in self.children]
             e = type(self)(*children)
         e.tag = self.tag
         return e
@@ -1300,9 +1591,11 @@ class Sequence(VariableChildExpansion):
     """
     Class for expansions to be spoken in sequence.
     """
+    __slots__ = ()
+
     def compile(self):
         self.validate_compilable()
-        seq = " ".join((e.compile() for e in self.children))
+        seq = " ".join((_compile_expansion(e) for e in self.children))
         return "%s%s" % (seq, self.compiled_tag)
 
     def _make_matcher_element(self):
@@ -1319,17 +1612,24 @@ class Literal(Expansion):
     """
     Expansion class for literals.
     """
+    __slots__ = ("_case_sensitive", "_text", "_lower_text")
+
     def __init__(self, text, case_sensitive=False):
+        self._case_sensitive = bool(case_sensitive)
+        super(Literal, self).__init__([])
+
         # Set _text and use the text setter to validate the input.
         self._text = ""
+        self._lower_text = ""
         self.text = text
-        self._case_sensitive = bool(case_sensitive)
-        super(Literal, self).__init__([])
 
     def __str__(self):
         return "%s('%s')" % (self.__class__.__name__, self.text)
 
     def __hash__(self):
+        return super(Literal, self).__hash__()
+
+    def _calculate_hash(self):
         return hash("%s" % self)
 
     @property
@@ -1351,6 +1651,7 @@ class Literal(Expansion):
     def case_sensitive(self, value):
         self._case_sensitive = bool(value)
         self.invalidate_matcher()
+        self._invalidate_hash()
 
     @property
     def text(self):
@@ -1363,17 +1664,25 @@ class Literal(Expansion):
         :rtype: str
         :returns: text
         """
-        text = self._text
-        if not self.case_sensitive:
-            text = text.lower()
-        return text
+        if self.case_sensitive:
+            return self._text
+        else:
+            return self._lower_text
 
     @text.setter
     def text(self, value):
         if not isinstance(value, string_types):
             raise TypeError("expected string, got %s instead" % value)
 
+        # Store the lowercase text too so that it isn't recalculated each time the
+        # text property is used. Intern both, as the same words are usually used
+        # in many literals. Python 2 can only intern byte strings.
+        lower_text = value.lower()
+        if type(value) is str:
+            value, lower_text = intern(value), intern(lower_text)
         self._text = value
+        self._lower_text = lower_text
+        self._invalidate_hash()
 
     def generate(self):
         """
@@ -1426,7 +1735,8 @@ class Literal(Expansion):
 
     def _make_matcher_element(self):
         # Return a case-sensitive or case-insensitive pyparsing Literal element.
-        text = self._text
+        # Use one space between words because speech is normalised the same way.
+        text = " ".join(self._text.split())
         if self.case_sensitive:
             matcher_cls = pyparsing.Literal
         else:
@@ -1442,6 +1752,8 @@ class RuleRef(NamedRuleRef):
     """
     Subclass of ``NamedRuleRef`` for referencing another rule with a Rule object.
     """
+    __slots__ = ("_referenced_rule",)
+
     def __init__(self, referenced_rule):
         """
         :param referenced_rule:
@@ -1478,13 +1790,16 @@ class Repeat(SingleChildExpansion):
 
         <repeat> = (please)+ don't crash;
     """
+    __slots__ = ("_repetitions_matched", "_match_index")
+
     def __init__(self, expansion):
         super(Repeat, self).__init__(expansion)
-        self._repetitions_matched = []
+        self._repetitions_matched = 0
+        self._match_index = {}
 
     def compile(self):
         self.validate_compilable()
-        return "(%s)+%s" % (self.child.compile(), self.compiled_tag)
+        return "(%s)+%s" % (_compile_expansion(self.child), self.compiled_tag)
 
     def generate(self):
         """
@@ -1500,6 +1815,14 @@ class Repeat(SingleChildExpansion):
     def __hash__(self):
         return super(Repeat, self).__hash__()
 
+    def __getstate__(self):
+        state = super(Repeat, self).__getstate__()
+
+        # The match index uses object IDs, so discard the repetition match data.
+        state['_repetitions_matched'] = 0
+        state['_match_index'] = {}
+        return state
+
     @property
     def repetitions_matched(self):
         """
@@ -1507,7 +1830,44 @@ class Repeat(SingleChildExpansion):
 
         :returns: int
         """
-        return len(self._repetitions_matched)
+        return self._repetitions_matched
+
+    def _get_repetition_values(self, e, name):
+        # Get a list of an expansion's saved match values with the specified name
+        # for each repetition. The index only has entries for descendants of this
+        # expansion, so nothing else needs to be checked.
+        values = self._match_index.get(id(e))
+        if values is None:
+            return []
+        return list(values[name])
+
+    def _index_repetition(self):
+        # Append the current match values of the child and its descendants to the
+        # match index. Values are keyed by expansion ID rather than by expansion
+        # because equal expansions in the same tree need separate entries.
+        index = self._match_index
+        for x in self.child._get_matcher_expansions():
+            values = index.get(id(x))
+            if values is None:
+                values = {"current_match": [], "matching_slice": []}
+                index[id(x)] = values
+            values["current_match"].append(x.current_match)
+            values["matching_slice"].append(x.matching_slice)
+        self._repetitions_matched += 1
+
+    def _restore_last_repetition(self):
+        # Restore the last repetition's match values, skipping None values.
+        index = self._match_index
+        for x in self.child._get_matcher_expansions():
+            values = index.get(id(x))
+            if values is None:
+                continue
+            current_match = values["current_match"][-1]
+            if current_match is not None:
+                x.current_match = current_match
+            matching_slice = values["matching_slice"][-1]
+            if matching_slice is not None:
+                x.matching_slice = matching_slice
 
     def get_expansion_matches(self, e):
         """
@@ -1515,11 +1875,7 @@ class Repeat(SingleChildExpansion):
 
         :returns: list
         """
-        if e.is_descendant_of(self):
-            return [values[e]["current_match"] for values in
-                    self._repetitions_matched]
-        else:
-            return []
+        return self._get_repetition_values(e, "current_match")
 
     def get_expansion_slices(self, e):
         """
@@ -1527,11 +1883,7 @@ class Repeat(SingleChildExpansion):
 
         :returns: list
         """
-        if e.is_descendant_of(self):
-            return [values[e]["matching_slice"] for values in
-                    self._repetitions_matched]
-        else:
-            return []
+        return self._get_repetition_values(e, "matching_slice")
 
     def _parse_action(self, tokens):
         # Call the super method to set current_match.
@@ -1539,17 +1891,15 @@ class Repeat(SingleChildExpansion):
 
         # Note: this method is called after the child's parse actions.
         if self._repetitions_matched:
-            # Restore the last repetition's match values.
-            last = self._repetitions_matched[len(self._repetitions_matched) - 1]
-            restore_current_matches(self.child, last, False)
+            self._restore_last_repetition()
         return tokens
 
     def _make_matcher_element(self):
         # Define an extra parse action for the child's matcher element.
         def f(tokens):
             if tokens.asList():
-                # Add current match values to the _repetitions_matched list.
-                self._repetitions_matched.append(save_current_matches(self.child))
+                # Add current match values to the match index.
+                self._index_repetition()
 
                 # Wipe current match values for the next repetition (if any).
                 self.child.reset_for_new_match()
@@ -1584,7 +1934,8 @@ class Repeat(SingleChildExpansion):
 
     def reset_match_data(self):
         super(Repeat, self).reset_match_data()
-        self._repetitions_matched = []
+        self._repetitions_matched = 0
+        self._match_index = {}
 
 
 class KleeneStar(Repeat):
@@ -1595,9 +1946,11 @@ class KleeneStar(Repeat):
 
         <kleene> = (please)* don't crash;
     """
+    __slots__ = ()
+
     def compile(self):
         self.validate_compilable()
-        return "(%s)*%s" % (self.child.compile(), self.compiled_tag)
+        return "(%s)*%s" % (_compile_expansion(self.child), self.compiled_tag)
         
     def generate(self):
         """
@@ -1623,12 +1976,17 @@ class OptionalGrouping(SingleChildExpansion):
     """
     Class for expansions that can be optionally spoken in a rule.
     """
+    __slots__ = ()
+
     def compile(self):
         self.validate_compilable()
-        return "[%s]%s" % (self.child.compile(), self.compiled_tag)
+        return "[%s]%s" % (_compile_expansion(self.child), self.compiled_tag)
 
     def generate(self):
-        return random.choice([self.child.generate(), ""])
+        # Only generate a string for the child if it is chosen.
+        if random.choice((True, False)):
+            return self.child.generate()
+        return ""
 
     def _make_matcher_element(self):
         return self._set_matcher_element_attributes(
@@ -1647,21 +2005,74 @@ class RequiredGrouping(Sequence):
     """
     Subclass of ``Sequence`` for wrapping multiple expansions in parenthesises.
     """
+    __slots__ = ()
+
     def compile(self):
         self.validate_compilable()
-        grouping = " ".join((e.compile() for e in self.children))
+        grouping = " ".join((_compile_expansion(e) for e in self.children))
         return "(%s)%s" % (grouping, self.compiled_tag)
 
     def __hash__(self):
         return super(RequiredGrouping, self).__hash__()
 
 
+class _WeightDict(dict):
+    """
+    Dictionary of alternatives to weights that invalidates its alternative set
+    when changed, as compiled strings, hash values and parser elements depend on
+    the weights.
+    """
+    def __init__(self, expansion):
+        super(_WeightDict, self).__init__()
+        self._expansion = expansion
+
+    def _invalidate(self):
+        # The expansion isn't set yet while unpickling.
+        e = self.__dict__.get("_expansion")
+        if e is not None:
+            e.invalidate_matcher()
+            e._invalidate_hash()
+
+    def __setitem__(self, key, value):
+        super(_WeightDict, self).__setitem__(key, value)
+        self._invalidate()
+
+    def __delitem__(self, key):
+        super(_WeightDict, self).__delitem__(key)
+        self._invalidate()
+
+    def clear(self):
+        super(_WeightDict, self).clear()
+        self._invalidate()
+
+    def pop(self, *args):
+        result = super(_WeightDict, self).pop(*args)
+        self._invalidate()
+        return result
+
+    def popitem(self):
+        result = super(_WeightDict, self).popitem()
+        self._invalidate()
+        return result
+
+    def setdefault(self, key, default=None):
+        result = super(_WeightDict, self).setdefault(key, default)
+        self._invalidate()
+        return result
+
+    def update(self, *args, **kwargs):
+        super(_WeightDict, self).update(*args, **kwargs)
+        self._invalidate()
+
+
 class AlternativeSet(VariableChildExpansion):
     """
     Class for a set of expansions, one of which can be spoken.
     """
+    __slots__ = ("_weights",)
+
     def __init__(self, *expansions):
-        self._weights = {}
+        self._weights = _WeightDict(self)
         super(AlternativeSet, self).__init__(*expansions)
 
     @property
@@ -1669,6 +2080,9 @@ class AlternativeSet(VariableChildExpansion):
         """
         The dictionary of alternatives to their weights.
 
+        Changes made to the dictionary in place are reflected in this expansion's
+        compile output and matching.
+
         :rtype: dict
         """
         return self._weights
@@ -1710,22 +2124,28 @@ class AlternativeSet(VariableChildExpansion):
         elif isinstance(child, string_types):
             compiled_child = child
             for c in self.children:
-                if c.compile() == compiled_child:
+                if _compile_expansion(c) == compiled_child:
                     child = c
 
+        # Setting the weight invalidates this expansion. This is a quick
+        # procedure if the matcher element hasn't been initialised.
         self._weights[child] = weight
 
-        # Invalidate this expansion. This is a quick procedure if the matcher
-        # element hasn't been initialised.
-        self.invalidate_matcher()
-
     def __hash__(self):
+        return super(AlternativeSet, self).__hash__()
+
+    def _can_cache_hash(self):
+        # Compiled children are used instead of child hash values, so the hash value
+        # can always be cached.
+        return True
+
+    def _calculate_hash(self):
         # The hash of an Alt.Set is a combination of the class name, tag and
         # hashes of children, similar to expansion string representations.
         # Hashes of children are sorted so that the same value is returned
         # regardless of child order. Weights are also included.
         child_hashes = sorted([
-            (e.compile(), float(self.weights.get(e, 1)))
+            (_compile_expansion(e), float(self._weights.get(e, 1)))
             for e in self.children
         ])
         return hash(
@@ -1734,12 +2154,12 @@ class AlternativeSet(VariableChildExpansion):
 
     def __copy__(self):
         result = super(AlternativeSet, self).__copy__()
-        result.weights = dict(self.weights)
+        result.weights = dict(self._weights)
         return result
 
     def __deepcopy__(self, memo):
         result = super(AlternativeSet, self).__deepcopy__(memo)
-        result.weights = dict(self.weights)
+        result.weights = dict(self._weights)
         return result
 
     def _validate_weights(self):
@@ -1759,13 +2179,13 @@ class AlternativeSet(VariableChildExpansion):
             # such that:
             # /<w 0>/ <e 0> | ... | /<w n-1>/ <e n-1>
             alt_set = "|".join([
-                "/%.4f/ %s" % (float(self._weights[e]), e.compile())
+                "/%.4f/ %s" % (float(self._weights[e]), _compile_expansion(e))
                 for e in self.children
             ])
         else:
             # Or do the same thing without the weights
             alt_set = "|".join([
-                e.compile() for e in self.children
+                _compile_expansion(e) for e in self.children
             ])
 
         # If there is a tag, we pretend there is a required grouping around this
@@ -1816,6 +2236,15 @@ class AlternativeSet(VariableChildExpansion):
             # Sort the list by weight (highest to lowest).
             children = [e for e, _ in sorted(children, key=lambda x: x[1])]
             children.reverse()
+        elif self.children and all(type(e) is Literal for e in self.children):
+            # If every alternative is a literal, try them from longest to shortest
+            # and stop at the first match. This selects the same alternative as an
+            # Or element, which tries every alternative to find the longest match.
+            children = sorted(self.children, reverse=True,
+                              key=lambda e: len(" ".join(e.text.split())))
+            return self._set_matcher_element_attributes(pyparsing.MatchFirst([
+                e.matcher_element for e in children
+            ]))
         else:
             children = self.children
 
@@ -1823,6 +2252,102 @@ class AlternativeSet(VariableChildExpansion):
             e.matcher_element for e in children
         ]))
 
+    def left_factor(self):
+        """
+        Rewrite this alternative set so that alternatives starting with the same
+        word share one ``Literal`` for it. This way the common prefix only needs to
+        be matched once. For example::
+
+            a b|a c|d   ->   a (b|c)|d
+            a|a b       ->   a [b]
+
+        Only untagged ``Literal`` and ``Sequence`` alternatives starting with an
+        untagged ``Literal`` are factored. Alternative sets with weights are not
+        changed.
+
+        This is an opt-in optimisation because the structure of the expansion tree
+        changes, which affects ``current_match`` values and equality comparisons.
+        """
+        if self._weights:
+            return
+
+        def split_first_word(e):
+            # Return the first word of e and a list of the remaining expansions, or
+            # None if e cannot be factored.
+            if e.tag is not None:
+                return None
+            if type(e) is Literal:
+                first, rest = e, []
+            elif type(e) is Sequence and e.children:
+                first, rest = e.children[0], list(e.children[1:])
+                if type(first) is not Literal or first.tag is not None:
+                    return None
+            else:
+                return None
+
+            words = first.text.split()
+            if not words:
+                return None
+            if len(words) > 1:
+                rest.insert(0, Literal(" ".join(words[1:]), first.case_sensitive))
+            return (words[0], first.case_sensitive), rest
+
+        # Group alternatives by their first word, keeping the original order.
+        groups = []
+        group_indices = {}
+        for child in self.children:
+            split = split_first_word(child)
+            if split is None:
+                groups.append((None, [(child, None)]))
+                continue
+
+            key, rest = split
+            if key in group_indices:
+                groups[group_indices[key]][1].append((child, rest))
+            else:
+                group_indices[key] = len(groups)
+                groups.append((key, [(child, rest)]))
+
+        # Build the new list of alternatives.
+        children = []
+        changed = False
+        for key, members in groups:
+            if len(members) == 1:
+                # Nothing to share; use the original alternative.
+                children.append(members[0][0])
+                continue
+
+            changed = True
+            word, case_sensitive = key
+            suffixes, optional = [], False
+            for _, rest in members:
+                if not rest:
+                    optional = True
+                elif len(rest) == 1:
+                    suffixes.append(rest[0])
+                else:
+                    suffixes.append(Sequence(*rest))
+
+            prefix = Literal(word, case_sensitive)
+            if not suffixes:
+                children.append(prefix)
+                continue
+
+            if len(suffixes) == 1:
+                suffix = suffixes[0]
+            else:
+                suffix = AlternativeSet(*suffixes)
+                suffix.left_factor()
+
+            if optional:
+                suffix = OptionalGrouping(suffix)
+            elif isinstance(suffix, AlternativeSet):
+                suffix = RequiredGrouping(suffix)
+            children.append(Sequence(prefix, suffix))
+
+        if changed:
+            self.children = children
+
     def __eq__(self, other):
         return (
             isinstance(other, AlternativeSet) and
@@ -1831,7 +2356,7 @@ class AlternativeSet(VariableChildExpansion):
             # Check that the children lists have the same contents, but the
             # ordering can be different. Also check the weights dictionaries.
             set(self.children) == set(other.children) and
-            self.weights == other.weights
+            self._weights == other._weights
         )
 
     @property
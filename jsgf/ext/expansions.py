@@ -3,6 +3,7 @@ This module contains extension rule expansion classes and functions.
 """
 
 import re
+from copy import deepcopy
 
 import pyparsing
 
@@ -22,6 +23,37 @@ from ..expansions import (
 # Define the regular expression used for dictation words.
 _word_regex_str = r"[\w\d?,\.\-_!;:']+"
 
+# Define the regular expression template used for matching one or more dictation
+# words in a single regex match instead of word by word.
+_words_regex_str = r"%s(?:\s+%s)*"
+
+
+class _CurrentMatchElement(pyparsing.Token):
+    """
+    Parser element for matching a Dictation expansion's ``current_match`` value
+    instead of one or more words.
+
+    The ``match_string`` attribute can be changed between matches without
+    rebuilding the parser elements of the expansion tree. ``None`` matches nothing
+    and ``""`` matches the empty string.
+    """
+    def __init__(self, match_string):
+        super(_CurrentMatchElement, self).__init__()
+        self.match_string = match_string
+        self.name = "current match"
+        self.errmsg = "Expected " + self.name
+        self.mayReturnEmpty = True
+        self.mayIndexError = False
+
+    def parseImpl(self, instring, loc, doActions=True):
+        match_string = self.match_string
+        if match_string == "":
+            return loc, []
+        elif match_string is not None and instring.startswith(match_string, loc):
+            return loc + len(match_string), match_string
+
+        raise pyparsing.ParseException(instring, loc, self.errmsg, self)
+
 
 def _collect_from_leaves(e, backtrack):
     result = []
@@ -134,6 +166,8 @@ class Dictation(Literal):
     expansions in public rules *or* use the ``JointTreeContext`` class before
     matching if you don't mind reducing the matching performance.
     """
+    __slots__ = ("_use_current_match",)
+
     def __init__(self):
         # Pass the empty string to the Literal constructor so that calling compile
         # yields "" or "" + the tag
@@ -151,7 +185,11 @@ class Dictation(Literal):
     def __deepcopy__(self, memo=None):
         return self.__copy__()
 
-    def __hash__(self):
+    def _can_cache_hash(self):
+        # Dictation hash values depend on ancestors, so they cannot be cached.
+        return False
+
+    def _calculate_hash(self):
         # A Dictation hash is a hash of the class name and each ancestor's string
         # representation.
         ancestors = []
@@ -188,16 +226,21 @@ class Dictation(Literal):
         # Invalidate the matcher.
         self.invalidate_matcher()
 
+    def _use_match_value(self, value):
+        # Set current_match and make the next match use it.
+        # If the matcher element already matches current_match values, update it
+        # in-place instead of invalidating the matchers of the whole tree.
+        self.current_match = value
+        element = self._matcher_element
+        if self._use_current_match and isinstance(element, _CurrentMatchElement):
+            element.match_string = self.current_match
+        else:
+            self.use_current_match = True
+
     def _make_matcher_element(self):
         # Handle the case where use_current_match is True.
         if self.use_current_match is True:
-            current_match = self.current_match
-            if current_match is None:
-                result = pyparsing.NoMatch()
-            elif current_match == "":
-                result = pyparsing.Empty()
-            else:
-                result = pyparsing.Literal(self.current_match)
+            result = _CurrentMatchElement(self.current_match)
 
             # Set the parse action and return the element.
             return result.setParseAction(self._parse_action)
@@ -219,24 +262,28 @@ class Dictation(Literal):
         # De-duplicate the list.
         next_literals = set(next_literals)
 
-        word = pyparsing.Regex(_word_regex_str, re.UNICODE)
         if next_literals:
             # Check if there is a next dictation literal. If there is, only match
             # one word for this expansion.
             if _word_regex_str in next_literals:
-                result = word
+                result = pyparsing.Regex(_word_regex_str, re.UNICODE)
 
             # Otherwise build an element to match one or more words stopping on
             # any of the next literals so that they aren't matched as dictation.
+            # A negative lookahead before each word does this in one regex.
             else:
-                next_literals = list(map(pyparsing.Literal, next_literals))
-                result = pyparsing.OneOrMore(
-                    word, stopOn=pyparsing.Or(next_literals)
+                word = "(?!%s)%s" % (
+                    "|".join(map(re.escape, sorted(next_literals))),
+                    _word_regex_str
                 )
+                result = pyparsing.Regex(_words_regex_str % (word, word),
+                                         re.UNICODE)
         else:
             # Handle the case of no literals ahead by allowing one or more Unicode
             # words without restrictions.
-            result = pyparsing.OneOrMore(word)
+            result = pyparsing.Regex(
+                _words_regex_str % (_word_regex_str, _word_regex_str), re.UNICODE
+            )
 
         return self._set_matcher_element_attributes(result)
 
@@ -256,20 +303,29 @@ class Dictation(Literal):
         return re.compile(regex, re.UNICODE)
 
 
-def dictation_in_expansion(e, no_literals=False):
-    dictation_expansions = []
-    others = []
+def _count_leaves(e):
+    """
+    Count the ``Dictation`` leaves and the other leaves of an expansion in one
+    traversal.
 
+    :param e: Expansion
+    :returns: tuple of the Dictation and other leaf counts
+    """
+    dictation_count, other_count = 0, 0
     for leaf in e.leaves:
         if isinstance(leaf, Dictation):
-            dictation_expansions.append(leaf)
+            dictation_count += 1
         else:
-            others.append(leaf)
+            other_count += 1
+    return dictation_count, other_count
 
+
+def dictation_in_expansion(e, no_literals=False):
+    dictation_count, other_count = _count_leaves(e)
     if no_literals:
-        return len(dictation_expansions) > 0 and len(others) == 0
+        return dictation_count > 0 and other_count == 0
     else:
-        return len(dictation_expansions) > 0
+        return dictation_count > 0
 
 
 def only_dictation_in_expansion(e):
@@ -286,6 +342,31 @@ def dictation_and_literals_in_expansion(e):
     return dictation_in_expansion(e, False)
 
 
+def _unique_alternatives(alternatives):
+    """
+    Return a list of alternatives with duplicates removed, keeping the first
+    occurrence of each.
+
+    Alternatives are only considered duplicates if they are equal and have the same
+    tag.
+
+    :param alternatives: iterable
+    :returns: list
+    """
+    # Group the kept alternatives by hash value and tag so that each alternative
+    # is only compared with those that could be equal to it. Some equal
+    # alternatives with differently tagged descendants have different hash
+    # values; these are kept, which only costs an extra expanded copy.
+    result = []
+    kept = {}
+    for e in alternatives:
+        same_key = kept.setdefault((hash(e), e.tag), [])
+        if not any(e == u for u in same_key):
+            same_key.append(e)
+            result.append(e)
+    return result
+
+
 def expand_dictation_expansion(expansion):
     """
     Take an expansion and expand any ``AlternativeSet`` with alternatives containing
@@ -295,6 +376,44 @@ def expand_dictation_expansion(expansion):
     :param expansion: Expansion
     :returns: list
     """
+    return list(expand_dictation_expansion_iter(expansion))
+
+
+def expand_dictation_expansion_iter(expansion):
+    """
+    Generator function version of ``expand_dictation_expansion``.
+
+    Expanded expansions are yielded one at a time as they are calculated, so
+    callers that only need the first few can stop early.
+
+    :param expansion: Expansion
+    :returns: generator
+    """
+    # Dictionary of expansion IDs to dictation_in_expansion results. Expansions
+    # are not changed once they have been checked, so the same subtrees don't need
+    # to be traversed again. Each expansion is stored with its result so that IDs
+    # are not reused.
+    dictation_memo = {}
+
+    # Placeholder expansion used when copying trees without certain subtrees. It
+    # is removed from each copy straight away, so one is enough.
+    placeholder = Literal("")
+
+    def has_dictation(e):
+        memo_value = dictation_memo.get(id(e))
+        if memo_value is None:
+            # Use the results for the children (or the referenced rule's
+            # expansion) so that each subtree is only traversed once.
+            if isinstance(e, Dictation):
+                result = True
+            elif isinstance(e, NamedRuleRef):
+                result = has_dictation(e.referenced_rule.expansion)
+            else:
+                result = any(has_dictation(c) for c in e.children)
+            memo_value = (e, result)
+            dictation_memo[id(e)] = memo_value
+        return memo_value[1]
+
     def is_unprocessed(e):
         if isinstance(e, AlternativeSet):
             jsgf_only_alt = False
@@ -303,7 +422,7 @@ def expand_dictation_expansion(expansion):
             # expansion sequence and SequenceRule.
             dictation_alts = 0
             for c in e.children:
-                if dictation_in_expansion(c):
+                if has_dictation(c):
                     dictation_alts += 1
                 else:
                     jsgf_only_alt = True
@@ -315,7 +434,7 @@ def expand_dictation_expansion(expansion):
                     # needs further processing
                     return True
         elif isinstance(e, (OptionalGrouping, KleeneStar)):
-            if dictation_in_expansion(e):
+            if has_dictation(e):
                 return True
             else:
                 # Handle the special case of dictation-free optionals in a sequence
@@ -328,7 +447,7 @@ def expand_dictation_expansion(expansion):
                         break
                     p = p.parent
 
-                if not p or no_dictation_in_expansion(p):
+                if not p or not has_dictation(p):
                     # There was no sequence ancestor or there wasn't dictation
                     # anywhere in the sequence
                     return False
@@ -354,32 +473,26 @@ def expand_dictation_expansion(expansion):
             if is_unprocessed(e):
                 return e
 
-    def find_goal(e, goal):
-        return find_expansion(e, lambda x: x == goal)
-
-    def process(e):
+    def process(current):
         """
-        Process an expansion recursively and return a list of expanded expansions.
+        Process an unprocessed expansion recursively and yield each expanded
+        expansion.
 
-        :param e: Expansion
-        :returns: list
+        :param current: Expansion for which is_unprocessed returns True
+        :returns: generator
         """
-        result = []
-        current = first_unprocessed_expansion(e)
-
-        # Handle cases where no processing is required
-        if not current:
-            return [e]
-
         copies = []
         if isinstance(current, AlternativeSet):
             # Create a replacements list with copies of the relevant children of
             # the AlternativeSet currently being processed.
             dictation_children = []  # again, not necessarily only dictation.
             jsgf_only_children = []
-            for child in current.children:
+
+            # Skip duplicate alternatives; each would otherwise produce an
+            # identical expanded expansion further down the line.
+            for child in _unique_alternatives(current.children):
                 # Add a deep copy of each child to one of the above lists.
-                if dictation_in_expansion(child):
+                if has_dictation(child):
                     dictation_children.append(child.copy())
                 else:
                     jsgf_only_children.append(child.copy())
@@ -393,26 +506,25 @@ def expand_dictation_expansion(expansion):
             replacements.extend(dictation_children)
 
         elif isinstance(current, (OptionalGrouping, KleeneStar)):
-            # Handle not required - remove from a copy
-            copy = current.root_expansion.copy()
-            copy_x = find_goal(copy, current)
-            copy_parent = copy_x.parent
-            ancestor = copy_parent
-
-            # Traverse up the parent tree and remove copy_x or one of its ancestors
-            # where there is another child
-            while ancestor:
-                if len(ancestor.children) > 1:
-                    ancestor.children.remove(copy_x)
-                    break
-
-                copy_x = ancestor
-                ancestor = ancestor.parent
-
-            # copy_x or one of its ancestors was removed from the tree correctly
-            # If this isn't true, the expansion is an empty tree and shouldn't be
-            # added.
+            # Handle not required - remove from a copy. Traverse up the parent tree
+            # to find current or the first ancestor of it that has another child.
+            # This is the expansion to remove.
+            x, ancestor = current, current.parent
+            while ancestor and len(ancestor.children) == 1:
+                x, ancestor = ancestor, ancestor.parent
+
+            # If there is no such ancestor, the copy would be an empty tree and
+            # shouldn't be added.
             if ancestor:
+                # Use the memo dictionary to substitute the placeholder for x so
+                # that the removed subtree isn't copied, then remove the
+                # placeholder.
+                copy = deepcopy(current.root_expansion, {id(x): placeholder})
+                copy_children = placeholder.parent.children
+                for i, child in enumerate(copy_children):
+                    if child is placeholder:
+                        copy_children.pop(i)
+                        break
                 copies.append(copy)
 
             # Let replacement loop handle required
@@ -423,34 +535,43 @@ def expand_dictation_expansion(expansion):
         else:
             replacements = []
 
+        root = current.root_expansion
         for replacement in replacements:
-            # Find the copy of the current expansion being processed
-            copy = current.root_expansion.copy()
-            copy_x = find_goal(copy, current)
-            copy_parent = copy_x.parent
-            if copy_parent:
-                index = copy_parent.children.index(copy_x)
-                copy_parent.children.remove(copy_x)
-                copy_parent.children.insert(index, replacement)
-            else:
-                # copy is the root expansion.
+            if current is root:
                 copy = replacement
+            else:
+                # Copy the tree, using the replacement in place of the current
+                # expansion being processed. Passing it in the memo dictionary means
+                # that the current expansion's subtree is not copied needlessly.
+                copy = deepcopy(root, {id(current): replacement})
             copies.append(copy)
 
         for copy in copies:
             next_unprocessed = first_unprocessed_expansion(copy)
-            if not next_unprocessed and copy not in result:
-                result.append(copy)
+            if not next_unprocessed:
+                yield copy
             else:
-                # Process the next unprocessed expansion and add the results.
-                # There are duplicates sometimes, so don't add them.
+                # Process the next unprocessed expansion and yield the results.
                 for r in process(next_unprocessed):
-                    if r not in result:
-                        result.append(r)
+                    yield r
 
-        return result
+    # Handle cases where no processing is required. Checking for Dictation
+    # expansions first is quicker as the search stops at the first one found.
+    if no_dictation_in_expansion(expansion):
+        yield expansion
+        return
+
+    first_unprocessed = first_unprocessed_expansion(expansion)
+    if not first_unprocessed:
+        yield expansion
+        return
 
-    return process(expansion)
+    # There are duplicates sometimes, so don't yield them.
+    yielded = []
+    for r in process(first_unprocessed):
+        if r not in yielded:
+            yielded.append(r)
+            yield r
 
 
 def calculate_expansion_sequence(expansion, should_deepcopy=True):
@@ -524,9 +645,13 @@ def calculate_expansion_sequence(expansion, should_deepcopy=True):
 
                 # Process the child_result list
                 for r in child_result:
+                    # Count the leaves of r once rather than traversing it for
+                    # each of the checks below.
+                    dictation_count, other_count = _count_leaves(r)
+
                     # Add child_group, the expansion r, and this expansion with
                     # its remaining children to the result list appropriately
-                    if only_dictation_in_expansion(r):  # fully processed
+                    if dictation_count and not other_count:  # fully processed
                         # Add child_group to the result list appropriately
                         new_expansion = generate_expansion_from_children(
                             e, child_group
@@ -538,10 +663,10 @@ def calculate_expansion_sequence(expansion, should_deepcopy=True):
                         # Reset child_group for the next partition
                         child_group = []
                         result.append(r)
-                    elif no_dictation_in_expansion(r):  # no processing required
+                    elif not dictation_count:  # no processing required
                         child_group.append(r)
 
-                    elif dictation_and_literals_in_expansion(r):
+                    else:  # dictation and literals
                         # Add child_group to the result list appropriately
                         new_expansion = generate_expansion_from_children(
                             e, child_group
@@ -9,6 +9,9 @@ from .expansions import dictation_in_expansion, expand_dictation_expansion
 from .rules import SequenceRule
 from jsgf import GrammarError, Grammar, Rule
 
+# Pattern used to check for compiled rules.
+_rule_pattern = re.compile("(public )?<.+> = .+;")
+
 
 class DictationGrammar(Grammar):
     """
@@ -26,6 +29,10 @@ class DictationGrammar(Grammar):
         self._original_rule_map = {}
         self._init_jsgf_only_grammar()
 
+        # Share the rule change count with the JSGF only grammar so that changes
+        # to its rules also invalidate this grammar's rule name lookup.
+        self._rule_changes = self._jsgf_only_grammar._rule_changes
+
         if rules:
             self.add_rules(*rules)
 
@@ -69,6 +76,9 @@ class DictationGrammar(Grammar):
         if not isinstance(rule, Rule):
             raise TypeError("object '%s' was not a JSGF Rule object" % rule)
 
+        # Invalidate the rule name lookup, as generated rules may be added below.
+        self._rules_changed()
+
         # Check if the same rule is already in the grammar.
         if rule.name in self.rule_names:
             if rule in self.rules:
@@ -158,6 +168,8 @@ class DictationGrammar(Grammar):
         else:
             rule_name = rule.name
 
+        # Invalidate the rule name lookup.
+        self._rules_changed()
         for k, v in list(self._original_rule_map.items()):
             if v.name == rule_name:
                 self._original_rule_map.pop(k)
@@ -184,11 +196,8 @@ class DictationGrammar(Grammar):
             else:
                 result = self._jsgf_only_grammar.compile()
 
-            # Check for compiled rules
-            rule_pattern = re.compile("(public )?<.+> = .+;")
-
-            # If there are none, set result to "".
-            if not rule_pattern.search(result):
+            # Check for compiled rules. If there are none, set result to "".
+            if not _rule_pattern.search(result):
                 result = ""
         except GrammarError as e:
             if len(self._dictation_rules) > 0:
@@ -244,11 +253,8 @@ class DictationGrammar(Grammar):
             sequence rule matches.
         :returns: list
         """
-        # Match against each match rule and remove any rules that didn't match
-        result = self.match_rules
-        for rule in tuple(result):
-            if not rule.matches(speech):
-                result.remove(rule)
+        # Match against each match rule, keeping only the rules that matched.
+        result = [rule for rule in self.match_rules if rule.matches(speech)]
 
         # Get the original rule for each rule in the result and ensure that their
         # current_match values reflect the generated rules' values.
@@ -6,8 +6,33 @@ from ..errors import GrammarError
 from ..expansions import Repeat, TraversalOrder, filter_expansion
 from ..rules import Rule
 
-from .expansions import (expand_dictation_expansion, calculate_expansion_sequence,
-                         Dictation, only_dictation_in_expansion)
+from .expansions import (expand_dictation_expansion,
+                         expand_dictation_expansion_iter,
+                         calculate_expansion_sequence, Dictation,
+                         only_dictation_in_expansion)
+
+
+def _find_dictation(e):
+    """
+    Return a tuple of the Dictation expansions in an expansion tree in post order.
+
+    The result is stored with the tree's other calculations unless the tree
+    references other rules, as changes to referenced rules don't discard stored
+    calculations.
+
+    :param e: Expansion
+    :returns: tuple
+    """
+    calc_name = "dictation_in_expansion"
+    result = e._lookup_calculation(calc_name, e)
+    if result is not e._NO_CALCULATION:
+        return result
+
+    result = tuple(filter_expansion(e, lambda x: isinstance(x, Dictation),
+                                    TraversalOrder.PostOrder))
+    if not e._references_rules():
+        e._store_calculation(calc_name, e, result)
+    return result
 
 
 class SequenceRule(Rule):
@@ -15,6 +40,9 @@ class SequenceRule(Rule):
     Class representing a list of regular expansions and ``Dictation`` expansions
     that must be spoken in a sequence.
     """
+    __slots__ = ("_original_expansion", "_can_repeat", "_sequence",
+                 "_current_index", "_refuse_matches", "_grafted_matches")
+
     def __init__(self, name, visible, expansion, case_sensitive=False):
         super(SequenceRule, self).__init__(name, visible, expansion, case_sensitive)
 
@@ -41,8 +69,11 @@ class SequenceRule(Rule):
             self._can_repeat = False
 
         # Check if expansion contains unexpanded AlternativeSets or Optionals
-        # with Dictation descendants
-        if expand_dictation_expansion(self.expansion) != [self.expansion]:
+        # with Dictation descendants. Only the first two expanded expansions need
+        # to be calculated for this.
+        expanded = expand_dictation_expansion_iter(self.expansion)
+        if (next(expanded) != self.expansion or
+                next(expanded, None) is not None):
             raise GrammarError("SequenceRule cannot accept expansions which "
                                "have not been expanded with the "
                                "expand_dictation_expansion function.")
@@ -51,6 +82,7 @@ class SequenceRule(Rule):
         self._sequence = tuple(calculate_expansion_sequence(self.expansion, False))
         self._current_index = 0
         self._refuse_matches = False
+        self._grafted_matches = None
         self._set_expansion_to_current()
 
     def __str__(self):
@@ -64,6 +96,13 @@ class SequenceRule(Rule):
         return hash("%s%s%s" % (hash(self.name), hash(self.visible),
                                 hash(self.original_expansion)))
 
+    def __getstate__(self):
+        state = super(SequenceRule, self).__getstate__()
+
+        # Discard the record of grafted matches, which includes a parser element.
+        state["_grafted_matches"] = None
+        return state
+
     @property
     def expansion_sequence(self):
         """
@@ -119,6 +158,29 @@ class SequenceRule(Rule):
 
         return result
 
+    def compile_sequence(self):
+        """
+        Compile this rule for each expansion in the sequence and return the
+        results in order.
+
+        This ignores ``refuse_matches`` and doesn't change the current expansion.
+
+        :returns: tuple
+        """
+        index, refuse_matches = self._current_index, self._refuse_matches
+        result = []
+        try:
+            for i in range(len(self._sequence)):
+                self._current_index = i
+                self._set_expansion_to_current()
+                result.append(self.compile())
+        finally:
+            # Restore the current expansion and refuse_matches value.
+            self._current_index = index
+            self._set_expansion_to_current()
+            self._refuse_matches = refuse_matches
+        return tuple(result)
+
     @property
     def has_next_expansion(self):
         """
@@ -136,7 +198,21 @@ class SequenceRule(Rule):
 
         :returns: bool
         """
-        return only_dictation_in_expansion(self._sequence[self._current_index])
+        e = self._sequence[self._current_index]
+
+        # Use the stored result if there is one. This is checked for each
+        # SequenceRule whenever a DictationGrammar rearranges its rules.
+        calc_name = "only_dictation_in_expansion"
+        result = e._lookup_calculation(calc_name, e)
+        if result is not e._NO_CALCULATION:
+            return result
+
+        # Store the result unless the expansion references other rules, as
+        # changes to referenced rules don't discard stored calculations.
+        result = only_dictation_in_expansion(e)
+        if not e._references_rules():
+            e._store_calculation(calc_name, e, result)
+        return result
 
     @property
     def refuse_matches(self):
@@ -181,7 +257,7 @@ class SequenceRule(Rule):
         :returns: str
         """
         matches = [x.current_match for x in self._sequence]
-        if all([m is not None for m in matches]):
+        if None not in matches:
             return " ".join(matches)
 
     def restart_sequence(self):
@@ -190,6 +266,7 @@ class SequenceRule(Rule):
         clears the match data of each sequence expansion.
         """
         self._current_index = 0
+        self._grafted_matches = None
         self._set_expansion_to_current()
         for expansion in self._sequence:
             expansion.reset_match_data()
@@ -212,14 +289,39 @@ class SequenceRule(Rule):
             result = super(SequenceRule, self).matches(speech)
 
             # Graft the matches in the sequence onto the original expansion used to
-            # create this SequenceRule.
-            SequenceRule.graft_sequence_matches(self, self._original_expansion)
+            # create this SequenceRule. Skip this if the matches are the same as
+            # last time, e.g. after a failed match, and the original expansion's
+            # matcher element hasn't been rebuilt because of changes to it.
+            original = self._original_expansion
+            values = tuple(e.current_match for e in self._sequence)
+            grafted = self._grafted_matches
+            if (grafted is None or grafted[0] != values or
+                    grafted[1] is not original._matcher_element):
+                SequenceRule.graft_sequence_matches(self, original)
+                self._grafted_matches = (values, original._matcher_element)
 
             # By default, don't let the current expansion be matched more than once
             self.refuse_matches = True
 
         return result
 
+    def advance(self, speech):
+        """
+        Match speech with the current expansion in the sequence and, if it matches,
+        move to the next expansion if there is one.
+
+        This is equivalent to calling ``matches`` and then ``set_next`` if the
+        result was True.
+
+        :param speech: str
+        :returns: bool
+        """
+        result = self.matches(speech)
+        if result and self.has_next_expansion:
+            self._current_index += 1
+            self._set_expansion_to_current()
+        return result
+
     @property
     def tags(self):
         """
@@ -251,25 +353,19 @@ class SequenceRule(Rule):
         :param sequence_rule: SequenceRule
         :param expansion: Expansion
         """
-        def is_dictation(x):
-            return isinstance(x, Dictation)
-
         # Collect Dictation in expansion and in all expansions in the
         # sequence
         dictation_in_seq = []
-        dictation_in_exp = filter_expansion(expansion, is_dictation,
-                                            TraversalOrder.PostOrder)
+        dictation_in_exp = _find_dictation(expansion)
         for e in sequence_rule._sequence:
-            dictation_in_seq.extend(filter_expansion(
-                e, is_dictation, TraversalOrder.PostOrder))
+            dictation_in_seq.extend(_find_dictation(e))
 
         # Set current_match of Dictation expansions in the given expansion to
         # current_match values of their respective counterparts in the sequence.
         for e1, e2 in zip(dictation_in_seq, dictation_in_exp):
             assert isinstance(e1, Dictation) and isinstance(e2, Dictation)
             # Stop the matches(speech) method from changing current_match
-            e2.use_current_match = True
-            e2.current_match = e1.current_match
+            e2._use_match_value(e1.current_match)
 
         # Then collect expansions with current_match set.
         matching = []
@@ -288,6 +384,8 @@ class PublicSequenceRule(SequenceRule):
     """
     SequenceRule subclass with ``visible`` set to True.
     """
+    __slots__ = ()
+
     def __init__(self, name, expansion, case_sensitive=False):
         super(PublicSequenceRule, self).__init__(name, True, expansion,
                                                  case_sensitive)
@@ -304,6 +402,8 @@ class PrivateSequenceRule(SequenceRule):
     """
     SequenceRule subclass with ``visible`` set to False.
     """
+    __slots__ = ()
+
     def __init__(self, name, expansion, case_sensitive=False):
         super(PrivateSequenceRule, self).__init__(name, False, expansion,
                                                  case_sensitive)
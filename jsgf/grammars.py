@@ -207,6 +207,13 @@ class Grammar(references.BaseRef):
         super(Grammar, self).__init__(name)
         self._rules = []
         self._imports = []
+
+        # Dictionary of rule names to rules, built as required. The change count is
+        # kept in a list so that it is shared with copies of this grammar, along
+        # with the rule list.
+        self._rule_index = None
+        self._rule_index_key = None
+        self._rule_changes = [0]
         self._import_env = {}
         self.jsgf_version, self.charset_name, self.language_name =\
             self.default_header_values
@@ -264,31 +271,36 @@ class Grammar(references.BaseRef):
 
         :returns: str
         """
-        result = self.jsgf_header
-        result += "grammar %s;\n" % self.name
-
+        # Collect each line in a list and join them at the end.
+        lines = [self.jsgf_header, "grammar %s;\n" % self.name]
         for i in self._imports:
-            result += "%s\n" % i.compile()
+            lines.append("%s\n" % i.compile())
 
         for r in self._rules:
             compiled = r.compile()
             if compiled and r.active:
-                result += "%s\n" % compiled
+                lines.append("%s\n" % compiled)
 
-        return result
+        return "".join(lines)
 
     def compile_to_file(self, file_path, compile_as_root_grammar=False):
         """
         Compile this grammar by calling ``compile`` and write the result to the
         specified file.
 
-        :param file_path: str
+        ``file_path`` can also be a file-like object with a ``write`` method, in
+        which case the result is written to it directly.
+
+        :param file_path: str | file-like object
         :param compile_as_root_grammar: bool
         """
         if compile_as_root_grammar:
             compiled_lines = self.compile_as_root_grammar()
         else:
             compiled_lines = self.compile()
+        if hasattr(file_path, "write"):
+            file_path.write(compiled_lines)
+            return
         with open(file_path, "w+") as f:
             f.write(compiled_lines)
 
@@ -327,19 +339,19 @@ class Grammar(references.BaseRef):
 
         :returns: str
         """
-        result = self.jsgf_header
-        result += "grammar %s;\n" % self.name
+        # Collect each line in a list and join them at the end.
+        lines = [self.jsgf_header, "grammar %s;\n" % self.name]
 
         # Add imports
         for i in self._imports:
-            result += "%s\n" % i.compile()
+            lines.append("%s\n" % i.compile())
 
         # Get rules in the grammar that are visible and active
         visible_rules = list(filter(lambda x: x.active, self.visible_rules))
 
         # Return the result if there are no rules that are visible and active
         if not visible_rules:
-            return result
+            return "".join(lines)
 
         # Temporarily set each visible rule to not visible
         for rule in visible_rules:
@@ -348,11 +360,11 @@ class Grammar(references.BaseRef):
         # Compile each rule and add its name to the names list if it compiled to
         # something. Rules can compile to the empty string if they are disabled.
         names = []
-        compiled_rules = ""
+        compiled_rules = []
         for rule in self.rules:
             compiled = rule.compile()
             if compiled:
-                compiled_rules += "%s\n" % compiled
+                compiled_rules.append("%s\n" % compiled)
             if rule in visible_rules and compiled:
                 names.append(rule.name)
 
@@ -362,14 +374,14 @@ class Grammar(references.BaseRef):
             refs = ["<%s>" % name for name in names]
             alt_set = "%s" % "|".join(refs)
             root_rule = "public <root> = %s;\n" % alt_set
-            result += root_rule
-            result += compiled_rules
+            lines.append(root_rule)
+            lines.extend(compiled_rules)
 
         # Set rule visibility back to normal
         for rule in visible_rules:
             rule.visible = True
 
-        return result
+        return "".join(lines)
 
     @property
     def imports(self):
@@ -407,6 +419,37 @@ class Grammar(references.BaseRef):
         """
     )
 
+    def _get_rule_index(self):
+        # Return a dictionary of rule names to the first rule in the grammar with
+        # each name. The dictionary is rebuilt if it was discarded or if the rule
+        # list has changed since it was built, which can happen through a copy of
+        # this grammar sharing the list.
+        key = (id(self._rules), self._rule_changes[0])
+        index = self._rule_index
+        if index is None or self._rule_index_key != key:
+            index = {}
+            for rule in self.rules:
+                index.setdefault(rule.name, rule)
+            self._rule_index = index
+            self._rule_index_key = key
+        return index
+
+    def _get_indexed_rule(self, name):
+        # Return the first rule in the grammar with the specified name using the
+        # rule name index, or None if there isn't one. Renames normally invalidate
+        # the index through the rule change count, but the index is also rebuilt if
+        # the indexed rule was renamed while in another grammar.
+        rule = self._get_rule_index().get(name)
+        if rule is not None and rule.name != name:
+            self._rule_index = None
+            rule = self._get_rule_index().get(name)
+        return rule
+
+    def _rules_changed(self):
+        # Record a change to the rule list or to a rule name. This invalidates the
+        # rule name index of this grammar and of any copies sharing its rules.
+        self._rule_changes[0] += 1
+
     import_names = property(
         lambda self: [import_.name for import_ in self._imports],
         doc="""
@@ -436,13 +479,35 @@ class Grammar(references.BaseRef):
         return self.__str__()
 
     def __eq__(self, other):
-        return (self.name == other.name and self.jsgf_header == other.jsgf_header
-                and self.rules == other.rules and self.imports == other.imports
-                and self.case_sensitive == other.case_sensitive)
+        if self is other:
+            return True
+
+        # Compare rules last because comparing expansion trees is the most
+        # expensive check.
+        return (self.name == other.name
+                and self.case_sensitive == other.case_sensitive
+                and self.jsgf_header == other.jsgf_header
+                and self._imports == other._imports
+                and self.rules == other.rules)
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __getstate__(self):
+        # Don't keep the rule name lookup, it is rebuilt as required.
+        state = self.__dict__.copy()
+        state['_rule_index'] = None
+        return state
+
+    def __copy__(self):
+        # Make a shallow copy directly instead of going through __reduce_ex__.
+        # The copy shares the rule and import lists with this grammar, so each
+        # grammar's rule name index is checked against the shared list before use.
+        g = type(self).__new__(type(self))
+        g.__dict__.update(self.__dict__)
+        g._rule_index = None
+        return g
+
     def add_rules(self, *rules):
         """
         Add multiple rules to the grammar.
@@ -478,9 +543,11 @@ class Grammar(references.BaseRef):
         if not isinstance(rule, Rule):
             raise TypeError("object '%s' was not a JSGF Rule object" % rule)
 
-        # Check if the same rule is already in the grammar.
-        if rule.name in self.rule_names:
-            if rule in self.rules:
+        # Check if the same rule is already in the grammar. Compare with the
+        # indexed rule first, as renamed rules may share its name.
+        existing = self._get_indexed_rule(rule.name)
+        if existing is not None:
+            if existing == rule or rule in self._rules:
                 # Silently return if the rule is comparable to another in the
                 # grammar.
                 return
@@ -491,7 +558,12 @@ class Grammar(references.BaseRef):
         # Set case sensitivity.
         rule.case_sensitive = self.case_sensitive
 
+        # Add the rule and keep the rule name index up to date.
+        index = self._get_rule_index()
         self._rules.append(rule)
+        self._rules_changed()
+        index.setdefault(rule.name, rule)
+        self._rule_index_key = (id(self._rules), self._rule_changes[0])
         rule.grammar = self
 
     def add_import(self, _import):
@@ -601,13 +673,15 @@ class Grammar(references.BaseRef):
         if not isinstance(name, string_types):
             raise TypeError("string expected, got %r instead" % name)
 
+        # Check local rules first. Rule names are always valid reference names, so
+        # the name only needs validating if no local rule has it.
+        rule = self._get_indexed_rule(name)
+        if rule is not None:
+            return rule
+
         if not references.optionally_qualified_name.matches(name):
             raise GrammarError("%r is not a valid JSGF reference name" % name)
 
-        for rule in self.rules:
-            if rule.name == name:
-                return rule
-
         # No local rules matched, so resolve import statements.
         self.resolve_imports()
         import_names = self.import_names
@@ -679,8 +753,12 @@ class Grammar(references.BaseRef):
             # Assume 'rule' is the name of a rule
             # Get the rule object with the name
             rule = self.get_rule_from_name(rule)
-        elif rule not in self.rules:
-            raise GrammarError("'%s' is not a rule in Grammar '%s'" % (rule, self))
+        else:
+            # Only the rule with the same name needs to be compared.
+            existing = self._get_indexed_rule(rule.name)
+            if existing is None or existing != rule:
+                raise GrammarError("'%s' is not a rule in Grammar '%s'"
+                                   % (rule, self))
 
         # Check if rule with name 'rule_name' is a dependency of another rule
         # in this grammar.
@@ -689,6 +767,7 @@ class Grammar(references.BaseRef):
                                "another rule." % rule)
 
         self._rules.remove(rule)
+        self._rules_changed()
         rule.grammar = None
 
     def enable_rule(self, rule):
@@ -708,11 +787,12 @@ class Grammar(references.BaseRef):
             rule_name = rule.name
             rule.enable()
 
-        if rule_name not in self.rule_names:
+        existing = self._get_indexed_rule(rule_name)
+        if existing is None:
             raise GrammarError("'%s' is not a rule in Grammar '%s'" % (rule, self))
 
         # Enable the rule
-        self.get_rule_from_name(rule_name).enable()
+        existing.enable()
 
     def disable_rule(self, rule):
         """
@@ -729,11 +809,12 @@ class Grammar(references.BaseRef):
             rule_name = rule.name
             rule.disable()
 
-        if rule_name not in self.rule_names:
+        existing = self._get_indexed_rule(rule_name)
+        if existing is None:
             raise GrammarError("'%s' is not a rule in Grammar '%s'" % (rule, self))
 
         # Disable the rule
-        self.get_rule_from_name(rule_name).disable()
+        existing.disable()
 
     def remove_import(self, _import):
         """
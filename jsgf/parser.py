@@ -116,17 +116,18 @@ line_delimiter = Suppress(OneOrMore(
 
 class WrapperExpansion(SingleChildExpansion):
     """ Wrapper expansion class used during the parser's post-processing stage. """
+    __slots__ = ()
 
 
 class WeightedExpansion(SingleChildExpansion):
     """
     Internal class used during parsing of alternative sets with weights.
     """
+    __slots__ = ("weight",)
 
     def __init__(self, expansion, weight):
         super(WeightedExpansion, self).__init__(expansion)
         self.weight = weight
-        self._child = expansion
 
     def __str__(self):
         return "%s(child=%s, weight=%s)" % (self.__class__.__name__,
@@ -159,6 +160,7 @@ class ParsedAlternativeSet(AlternativeSet):
 
     This class handles unravelling nested alternative sets.
     """
+    __slots__ = ()
 
     def __init__(self, *expansions):
         children = []
@@ -4,6 +4,8 @@ This module contains the base class for referencing rules and grammars by name.
 
 import re
 
+from six import string_types
+from six.moves import intern
 from pyparsing import Regex, Optional, OneOrMore, Combine
 from pyparsing import Literal as PPLiteral  # to differentiate from jsgf.Literal
 
@@ -44,10 +46,39 @@ grammar_name = Combine(_grammar_base_name ^ Combine(
     .setName("grammar name")
 
 
+# Results of name validation, keyed by validation function and name. Validating
+# names with pyparsing is slow compared to the rest of rule construction and the
+# same names are often used many times.
+_valid_names = {}
+
+# Maximum number of validation results to keep in _valid_names.
+_MAX_VALID_NAMES = 10000
+
+
+def _is_valid_name(valid, name):
+    # Return whether a name is valid according to a validation function, using
+    # the stored result if there is one.
+    if not isinstance(name, string_types):
+        return valid(name)
+
+    key = (valid, name)
+    result = _valid_names.get(key)
+    if result is None:
+        result = bool(valid(name))
+        if len(_valid_names) >= _MAX_VALID_NAMES:
+            _valid_names.clear()
+        _valid_names[key] = result
+    return result
+
+
 class BaseRef(object):
     """
     Base class for JSGF rule and grammar references.
     """
+    # Sub-classes store the name in the _name attribute, which is declared as a
+    # slot where they use __slots__.
+    __slots__ = ()
+
     def __init__(self, name):
         # Set the _name attribute and use the setter to validate the input
         # name.
@@ -81,9 +112,14 @@ class BaseRef(object):
     @name.setter
     def name(self, value):
         # Validate the format of name
-        if not self.valid(value):
+        if not _is_valid_name(self.valid, value):
             raise GrammarError("'%s' is not a valid %s name"
                                % (value, self.__class__.__name__))
+
+        # Intern names so that comparing equal names and using them as dictionary
+        # keys is cheap. Python 2 can only intern byte strings.
+        if type(value) is str:
+            value = intern(value)
         self._name = value
 
     @staticmethod
@@ -7,8 +7,9 @@ rules.
 
 from .errors import GrammarError
 from . import references
-from .expansions import Expansion, Literal, NamedRuleRef, filter_expansion, \
-    map_expansion, TraversalOrder
+from .expansions import (Expansion, Literal, NamedRuleRef, filter_expansion,
+                          TraversalOrder, _compile_expansion, _get_state,
+                          _iter_expansion, _set_state)
 
 
 class Rule(references.BaseRef):
@@ -30,6 +31,10 @@ class Rule(references.BaseRef):
     used as rule names. You can however change the case to 'null' or 'void' to use
     them, as names are case-sensitive.
     """
+
+    __slots__ = ("_name", "visible", "_expansion", "_active", "grammar",
+                 "_case_sensitive")
+
     def __init__(self, name, visible, expansion, case_sensitive=False):
         """
         :param name: str
@@ -38,17 +43,34 @@ class Rule(references.BaseRef):
         :param case_sensitive: whether rule literals should be case sensitive
             (default False).
         """
+        self.grammar = None
         super(Rule, self).__init__(name)
         self.visible = visible
         self._expansion = None
         self.expansion = expansion
         self._active = True
-        self.grammar = None
 
         # Set case sensitivity (backing attribute and property).
         self._case_sensitive = case_sensitive
         self.case_sensitive = case_sensitive
 
+    @property
+    def name(self):
+        """
+        The rule's name.
+
+        :returns: str
+        """
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        references.BaseRef.name.fset(self, value)
+
+        # Invalidate the rule name lookup of the grammar this rule is in.
+        if self.grammar is not None:
+            self.grammar._rules_changed()
+
     @property
     def expansion(self):
         """
@@ -101,11 +123,9 @@ class Rule(references.BaseRef):
         self._expansion = Expansion.make_expansion(value)
 
         # Set the rule attribute for the rule's expansions
-        def set_rule(x):
+        for x in _iter_expansion(self._expansion, shallow=True):
             x.rule = self
 
-        map_expansion(self._expansion, set_rule, shallow=True)
-
     def compile(self):
         """
         Compile this rule's expansion tree and return the result.
@@ -115,7 +135,7 @@ class Rule(references.BaseRef):
         if not self._active:
             return ""
 
-        expansion = self.expansion.compile()
+        expansion = _compile_expansion(self.expansion)
         if not expansion:  # the compiled expansion is None or ""
             return ""
 
@@ -146,6 +166,12 @@ class Rule(references.BaseRef):
     def __repr__(self):
         return self.__str__()
 
+    def __getstate__(self):
+        return _get_state(self)
+
+    def __setstate__(self, state):
+        _set_state(self, state)
+
     def __hash__(self):
         # The hash of a rule is the hash of its name, visibility and expansion
         # hashes combined.
@@ -190,7 +216,8 @@ class Rule(references.BaseRef):
 
         # Recursively operate on the rule expansion tree. Do *not* operate on
         # referenced rules directly.
-        map_expansion(self.expansion, func, shallow=True)
+        for x in _iter_expansion(self.expansion, shallow=True):
+            func(x)
 
     def enable(self):
         """
@@ -235,16 +262,15 @@ class Rule(references.BaseRef):
 
             <rule> = [test] test;
 
+        Whitespace between words in ``speech`` is not significant, so runs of
+        spaces or tabs match a single space. See :meth:`Expansion.matches`.
+
         :param speech: str
         :returns: bool
         """
         if not self._active:
             return False
 
-        # Strip whitespace at the start of 'speech' and lower it to match regex
-        # properly.
-        speech = speech.lstrip()
-
         # Reset match data for this rule and referenced rules.
         self.expansion.reset_for_new_match()
 
@@ -262,15 +288,18 @@ class Rule(references.BaseRef):
 
         If no part matches or the rule is disabled, return None.
 
+        The returned part is taken from ``speech`` after lowering it and
+        normalising its whitespace to one space between words, so it may not be
+        a substring of the original ``speech`` string.
+
         :param speech: str
         :returns: str | None
         """
         if not self._active:
             return None
 
-        # Strip whitespace at the start of 'speech' and lower it to match regex
-        # properly.
-        speech = speech.lstrip().lower()
+        # Normalise whitespace in 'speech' and lower it to match regex properly.
+        speech = " ".join(speech.lower().split())
 
         # Reset match data for this rule and referenced rules.
         self.expansion.reset_for_new_match()
@@ -293,13 +322,25 @@ class Rule(references.BaseRef):
 
         :returns: list
         """
+        # Use the stored tags of the expansion tree if possible. Tags are only
+        # stored if no other rules are referenced, as changes to referenced rules
+        # don't discard the stored calculations of this rule's expansion tree.
+        e = self.expansion
+        calc_name = "tags_in_expansion"
+        result = e._lookup_calculation(calc_name, e)
+        if result is not e._NO_CALCULATION:
+            return list(result)
+
         # Get tagged expansions
         tagged_expansions = filter_expansion(
-            self.expansion, lambda e: e.tag, TraversalOrder.PostOrder
+            e, lambda x: x.tag, TraversalOrder.PostOrder
         )
 
-        # Return a list containing the tags of each expansion.
-        return list(map(lambda e: e.tag, tagged_expansions))
+        # Store and return the tags of each expansion.
+        result = tuple(map(lambda x: x.tag, tagged_expansions))
+        if not e._references_rules():
+            e._store_calculation(calc_name, e, result)
+        return list(result)
 
     @property
     def matched_tags(self):
@@ -402,6 +443,8 @@ class PublicRule(Rule):
     """
     Rule subclass with ``visible`` set to True.
     """
+    __slots__ = ()
+
     def __init__(self, name, expansion, case_sensitive=False):
         super(PublicRule, self).__init__(name, True, expansion, case_sensitive)
 
@@ -417,6 +460,8 @@ class PrivateRule(Rule):
     """
     Rule subclass with ``visible`` set to False.
     """
+    __slots__ = ()
+
     def __init__(self, name, expansion, case_sensitive=False):
         super(PrivateRule, self).__init__(name, False, expansion, case_sensitive)
 
@@ -1,6 +1,9 @@
 import unittest
+import pickle
+import sys
 from copy import deepcopy
 
+from mock import patch
 from six import text_type
 
 from jsgf import *
@@ -127,6 +130,31 @@ class Compilation(unittest.TestCase):
         e1.tag = None
         self.assertEqual(e1.compile(), "a")
 
+    def test_changes_after_compiling(self):
+        # Test that compiled strings stored for descendants are not reused after
+        # the tree changes.
+        a = Literal("a")
+        e = Sequence(OptionalGrouping(a), AlternativeSet("b", "c"))
+        self.assertEqual(e.compile(), "[a] b|c")
+        a.text = "d"
+        self.assertEqual(e.compile(), "[d] b|c")
+        a.tag = "t"
+        self.assertEqual(e.compile(), "[d { t }] b|c")
+        e.children[1].children.append("e")
+        self.assertEqual(e.compile(), "[d { t }] b|c|e")
+        e.children[1].set_weight(0, 2)
+        e.children[1].weights = {1: 1, 2: 1}
+        self.assertEqual(e.compile(),
+                         "[d { t }] /2.0000/ b|/1.0000/ c|/1.0000/ e")
+        e.children.pop(0)
+        self.assertEqual(e.compile(), "/2.0000/ b|/1.0000/ c|/1.0000/ e")
+
+        # Adding an expansion that is already a child also changes the result.
+        e = Sequence("a", "b")
+        self.assertEqual(e.compile(), "a b")
+        e.children.append(e.children[0])
+        self.assertEqual(e.compile(), "a b a")
+
 
 class ParentCase(unittest.TestCase):
     def setUp(self):
@@ -453,6 +481,42 @@ class Hashing(unittest.TestCase):
             hash(AlternativeSet(Sequence("a", "b"), "c")),
             hash(AlternativeSet("c", Sequence("a", "b"))))
 
+    def test_changes_after_mutation(self):
+        # Test that hash values are recalculated after expansion trees are changed.
+        def assert_hash_changed(e, change):
+            before = hash(e)
+            change()
+            self.assertNotEqual(hash(e), before)
+            self.assertEqual(hash(e), hash(e.copy()))
+
+        e = Sequence("a", AlternativeSet("b", Sequence("c", "d")))
+        literal_d = e.children[1].children[1].children[1]
+        assert_hash_changed(e, lambda: setattr(literal_d, "text", "e"))
+        assert_hash_changed(e, lambda: setattr(literal_d, "tag", "tag"))
+        assert_hash_changed(e, lambda: e.children[1].children.append("f"))
+        assert_hash_changed(e, lambda: e.children.pop(0))
+        assert_hash_changed(e, lambda: e.children[0].set_weight(0, 2))
+
+        e = Sequence(OptionalGrouping(Literal("A", True)), NamedRuleRef("x"))
+        literal_a = e.children[0].child
+        assert_hash_changed(e, lambda: setattr(literal_a, "case_sensitive", False))
+        assert_hash_changed(e, lambda: setattr(e.children[1], "name", "y"))
+
+        # Test that Dictation hash values are recalculated when ancestors change.
+        d = Dictation()
+        e = Sequence("a", Sequence(d))
+        before = hash(d)
+        e.children[0].text = "b"
+        self.assertNotEqual(hash(d), before)
+
+    def test_same_parent(self):
+        # Test that setting the same parent again keeps cached values.
+        e = Sequence("a", "b")
+        hash(e)
+        self.assertIsNotNone(e._hash_cache)
+        e.children[0].parent = e
+        self.assertIsNotNone(e._hash_cache)
+
     def test_rule_ref(self):
         self.assertEqual(RuleRef(Rule("test", True, "test")),
                          RuleRef(Rule("test", True, "test")))
@@ -547,6 +611,14 @@ class LiteralProperties(unittest.TestCase):
         l.text = str("b")
         self.assertEqual(l.text, "b")
 
+    def test_text_interned(self):
+        """Equal str Literal text values are the same object."""
+        e1, e2 = Literal("".join(["hel", "lo"])), Literal("Hello")
+        self.assertIs(e1.text, e2.text)
+        e2.case_sensitive = True
+        e2.text = "".join(["He", "llo"])
+        self.assertIs(e2.text, Literal("Hello", True).text)
+
     def test_set_text_invalid_types(self):
         l = Literal("")
 
@@ -699,6 +771,40 @@ class MutuallyExclusiveOfCase(unittest.TestCase):
         self.assertFalse(a.mutually_exclusive_of(d))
         self.assertFalse(a.mutually_exclusive_of(e))
 
+    def test_tree_changes(self):
+        """Stored calculations are discarded when the expansion tree changes."""
+        a, b = Literal("a"), Literal("b")
+        e = Sequence(a, b)
+        self.assertFalse(a.mutually_exclusive_of(b))
+
+        # Move the literals into an alternative set in the same tree.
+        e.children = []
+        e.children = [AlternativeSet(a, b)]
+        self.assertTrue(a.mutually_exclusive_of(b))
+        self.assertTrue(b.mutually_exclusive_of(a))
+
+        # Move them back.
+        e.children[0].children = []
+        e.children = [a, b]
+        self.assertFalse(b.mutually_exclusive_of(a))
+
+    def test_bounded_calculations(self):
+        """The number of stored calculations is limited."""
+        e = AlternativeSet(*["w%d" % i for i in range(10)])
+        with patch.object(Expansion, "_MAX_STORED_CALCULATIONS", 5):
+            for child in e.children[1:]:
+                self.assertTrue(e.children[0].mutually_exclusive_of(child))
+                self.assertLessEqual(len(e._lookup_dict["mutually_exclusive_of"]),
+                                     5)
+
+    def test_invalidate_calculations(self):
+        e = AlternativeSet("a", "b")
+        a, b = e.children
+        self.assertTrue(a.mutually_exclusive_of(b))
+        self.assertTrue(e._lookup_dict["mutually_exclusive_of"])
+        a.invalidate_calculations()
+        self.assertFalse(e._lookup_dict["mutually_exclusive_of"])
+
 
 class ExpansionTreeConstructs(unittest.TestCase):
     """
@@ -862,6 +968,20 @@ class ExpansionTreeConstructs(unittest.TestCase):
             flat_map_expansion(e, order=TraversalOrder.PostOrder),
             [a, b, c, alt_set, d, e])
 
+    def test_flat_map_deep_tree(self):
+        """flat_map_expansion isn't limited by the recursion depth"""
+        depth = sys.getrecursionlimit() + 100
+        e = Literal("a")
+        for _ in range(depth):
+            e = Sequence(e)
+
+        result = flat_map_expansion(e, order=TraversalOrder.PreOrder)
+        self.assertEqual(len(result), depth + 1)
+        self.assertIs(result[0], e)
+        result = flat_map_expansion(e, order=TraversalOrder.PostOrder)
+        self.assertEqual(len(result), depth + 1)
+        self.assertIs(result[-1], e)
+
     def test_joint_tree_context(self):
         """JointTreeContext joins and detaches trees correctly"""
         r1 = PublicRule("r1", "hi")
@@ -1101,6 +1221,88 @@ class AlternativeWeightTests(unittest.TestCase):
         e.weights.update({a: "2"})
         self.assertEqual(e.compile(), "/2.0000/ a|/1.0000/ b|/2.5000/ c")
 
+        # Check that changing weights in place is reflected in the compiled
+        # output of parent expansions and rules.
+        r = PublicRule("r", Sequence("say", e))
+        self.assertEqual(r.compile(), "public <r> = say /2.0000/ a|/1.0000/ b|"
+                                      "/2.5000/ c;")
+        e.weights[b] = 3
+        self.assertEqual(r.compile(), "public <r> = say /2.0000/ a|/3.0000/ b|"
+                                      "/2.5000/ c;")
+
+        # Check that reading weights, hashing and comparing don't discard the
+        # parser element, and that changes through an earlier reference to the
+        # dictionary are still reflected.
+        e.weights = {a: 2, b: 3, c: 2.5}
+        weights = e.weights
+        self.assertTrue(r.matches("say b"))
+        element = r.expansion.matcher_element
+        hash(e)
+        self.assertEqual(e, e.copy())
+        self.assertIs(e.weights, weights)
+        self.assertIs(r.expansion.matcher_element, element)
+        weights[b] = 0
+        self.assertEqual(r.compile(), "public <r> = say /2.0000/ a|/0.0000/ b|"
+                                      "/2.5000/ c;")
+        self.assertFalse(r.matches("say b"))
+
+        # Check that weights survive pickling and still invalidate afterwards.
+        e2 = pickle.loads(pickle.dumps(e))
+        self.assertEqual(e2.compile(), e.compile())
+        e2.weights.update({e2.children[1]: 1})
+        self.assertEqual(e2.compile(), "/2.0000/ a|/1.0000/ b|/2.5000/ c")
+
+
+class AlternativeSetLeftFactor(unittest.TestCase):
+    def test_common_prefix(self):
+        e = AlternativeSet("hello world", Sequence("hello", "there"), "hi")
+        e.left_factor()
+        self.assertEqual(e, AlternativeSet(
+            Sequence("hello", RequiredGrouping(AlternativeSet("world", "there"))),
+            "hi"
+        ))
+        self.assertEqual(e.compile(), "hello (world|there)|hi")
+
+        # Check that matching still works as before.
+        r = PublicRule("test", e)
+        self.assertTrue(r.matches("hello there"))
+        self.assertTrue(r.matches("hi"))
+        self.assertFalse(r.matches("hello"))
+
+    def test_optional_suffix(self):
+        e = AlternativeSet("a", "a b", "a b c")
+        e.left_factor()
+        self.assertEqual(e.compile(), "a [b [c]]")
+        r = PublicRule("test", e)
+        for s in ["a", "a b", "a b c"]:
+            self.assertTrue(r.matches(s))
+
+    def test_unchanged(self):
+        """Alternatives are only factored when possible."""
+        # No common prefixes.
+        a, b = Literal("a"), Literal("b")
+        e = AlternativeSet(a, b)
+        e.left_factor()
+        self.assertIs(e.children[0], a)
+        self.assertIs(e.children[1], b)
+
+        # Tagged alternatives, dictation and case sensitivity differences.
+        e = AlternativeSet(Sequence("a", "b"), Literal("a c"),
+                           Sequence(Dictation(), "a"), Literal("A", True))
+        e.children[0].tag = "tag"
+        children = list(e.children)
+        e.left_factor()
+        for c1, c2 in zip(e.children, children):
+            self.assertIs(c1, c2)
+
+        # Weighted alternative sets.
+        e = AlternativeSet("a b", "a c")
+        e.weights = {"a b": 1, "a c": 2}
+        children = list(e.children)
+        e.left_factor()
+        for c1, c2 in zip(e.children, children):
+            self.assertIs(c1, c2)
+
 
 if __name__ == '__main__':
     unittest.main()
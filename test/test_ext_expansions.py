@@ -5,6 +5,7 @@ from jsgf import PublicRule, Rule
 from jsgf.expansions import *
 from jsgf.ext import Dictation
 
+from jsgf.ext.expansions import expand_dictation_expansion_iter
 from jsgf.ext.rules import calculate_expansion_sequence, expand_dictation_expansion
 
 # Create shorthand aliases for some expansions as they're used here A LOT
@@ -527,6 +528,49 @@ class ExpandedDictationExpansion(unittest.TestCase):
             Seq(Dict(), "c", Dict(), "e")
         ])
 
+    def test_identical_alt_sets(self):
+        e1 = Seq(AS("a", Dict()), "b", AS("a", Dict()))
+        self.assertListEqual(expand_dictation_expansion(e1), [
+            Seq("a", "b", "a"),
+            Seq("a", "b", Dict()),
+            Seq(Dict(), "b", "a"),
+            Seq(Dict(), "b", Dict())
+        ])
+
+    def test_duplicate_alternatives(self):
+        e1 = AS("a", "b", "a", Dict(), Dict())
+        self.assertListEqual(expand_dictation_expansion(e1), [
+            AS("a", "b"),
+            Dict()
+        ])
+
+        e2 = Seq(AS(Seq("a", Dict()), Seq("a", Dict())), "c")
+        self.assertListEqual(expand_dictation_expansion(e2), [
+            Seq(Seq("a", Dict()), "c")
+        ])
+
+        # Alternatives with different tags are not duplicates.
+        a1, a2 = Literal("a"), Literal("a")
+        a2.tag = "tag"
+        e3 = AS(a1, a2, Dict())
+        result = expand_dictation_expansion(e3)
+        self.assertListEqual(result, [AS("a", "a"), Dict()])
+        self.assertListEqual([c.tag for c in result[0].children], [None, "tag"])
+
+    def test_generator_version(self):
+        e1 = Seq(AS("a", "b", Dict()), "c", AS("d", Dict()))
+        result = expand_dictation_expansion_iter(e1)
+        self.assertEqual(next(result), Seq(AS("a", "b"), "c", "d"))
+        self.assertEqual(next(result), Seq(AS("a", "b"), "c", Dict()))
+        self.assertListEqual(list(result), [
+            Seq(Dict(), "c", "d"),
+            Seq(Dict(), "c", Dict())
+        ])
+
+        # Dictation-free expansions are yielded untouched.
+        e2 = AS("hi", "hello")
+        self.assertListEqual(list(expand_dictation_expansion_iter(e2)), [e2])
+
     def test_mutually_exclusive_dictation(self):
         e1 = AS(Seq("a", Dict()), Seq(Dict(), "b"))
         self.assertListEqual(expand_dictation_expansion(e1), [
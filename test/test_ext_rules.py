@@ -15,6 +15,16 @@ def generate_rule(e):
     return PublicSequenceRule("test", e)
 
 
+def multiple_dictation_sequences():
+    # Return new sequences with multiple dictation expansions for the match and
+    # compile tests.
+    return (
+        Seq(Dict(), "test", "testing", Dict()),
+        Seq("test", Dict(), "testing", Dict()),
+        Seq("test", "testing", Dict(), "more", "testing", Dict()),
+    )
+
+
 class SequenceRulePropertiesCase(unittest.TestCase):
     def test_dictation_only_one_expansion(self):
         r1 = generate_rule(Dict())
@@ -42,6 +52,15 @@ class SequenceRulePropertiesCase(unittest.TestCase):
         r1.set_next()
         self.assertTrue(r1.current_is_dictation_only)
 
+    def test_dictation_only_after_changes(self):
+        # Test that the property is correct after the current expansion changes.
+        r1 = generate_rule(Seq(Dict(), Dict()))
+        self.assertTrue(r1.current_is_dictation_only)
+        r1.expansion.children.append(Literal("hello"))
+        self.assertFalse(r1.current_is_dictation_only)
+        r1.expansion.children.pop()
+        self.assertTrue(r1.current_is_dictation_only)
+
     def test_next_in_sequence_methods(self):
         r1 = generate_rule(Seq("hello", Dict()))
         self.assertTrue(r1.has_next_expansion)
@@ -205,6 +224,49 @@ class SequenceRuleGraftMatchMethods(unittest.TestCase):
         self.assertEqual(seq.current_match, "test with lots of dictation and JSGF "
                                             "expansions hopefully maybe")
 
+    def test_graft_after_restart(self):
+        # Grafting matches from later passes through the sequence should work
+        # without rebuilding the original expansion's matcher element.
+        r1 = PublicRule("test", Seq("hello", Dict(), "and", Dict()))
+        r2 = generate_rule(r1.expansion)
+        seq = r1.expansion
+        d1, d2 = seq.children[1], seq.children[3]
+        element = None
+        for words in [("there", "welcome"), ("world", "goodbye")]:
+            r2.restart_sequence()
+            r2.matches("hello")
+            r2.set_next()
+            r2.matches(words[0])
+            r2.set_next()
+            r2.matches("and")
+            r2.set_next()
+            r2.matches(words[1])
+            self.assertEqual(seq.current_match, "hello %s and %s" % words)
+            self.assertEqual(d1.current_match, words[0])
+            self.assertEqual(d2.current_match, words[1])
+            if element is None:
+                element = seq.matcher_element
+            self.assertIs(seq.matcher_element, element)
+
+    def test_graft_after_failed_matches(self):
+        r1 = PublicRule("test", Seq("hello", Dict()))
+        r2 = generate_rule(r1.expansion)
+        d = r1.expansion.children[1]
+        self.assertTrue(r2.advance("hello"))
+        self.assertTrue(r2.matches("there"))
+        self.assertEqual(d.current_match, "there")
+
+        # Failed matches should be grafted, including repeated ones.
+        for _ in range(2):
+            r2.refuse_matches = False
+            self.assertFalse(r2.matches(""))
+            self.assertEqual(d.current_match, None)
+
+        r2.refuse_matches = False
+        self.assertTrue(r2.matches("world"))
+        self.assertEqual(d.current_match, "world")
+        self.assertEqual(r1.expansion.current_match, "hello world")
+
     def test_graft_matches_onto_unrelated(self):
         """
         Test graft_sequence_matches using a different expansion than the original
@@ -239,8 +301,27 @@ class SequenceRuleGraftMatchMethods(unittest.TestCase):
         self.assertEqual(e3.children[0].current_match, None)
         self.assertEqual(e3.children[1].current_match, None)
 
+    def test_graft_matches_after_changes(self):
+        # Grafting onto an expansion should take changes to it into account.
+        r = generate_rule(Seq(Dict(), "and", Dict()))
+        r.matches("hello")
+        r.set_next()
+        r.matches("and")
+        r.set_next()
+        r.matches("goodbye")
+        e = Seq(Dict(), "and")
+        SequenceRule.graft_sequence_matches(r, e)
+        self.assertEqual(e.current_match, "hello and")
+        e.children.append(Dict())
+        SequenceRule.graft_sequence_matches(r, e)
+        self.assertEqual(e.current_match, "hello and goodbye")
+        self.assertEqual(e.children[2].current_match, "goodbye")
+
 
 class SequenceRuleEntireMatchProperty(unittest.TestCase):
+    def setUp(self):
+        self.hello_dictation = Seq("hello", Dict())
+
     def assert_no_entire_match(self, rule):
         self.assertEqual(
             rule.entire_match, None,
@@ -257,7 +338,7 @@ class SequenceRuleEntireMatchProperty(unittest.TestCase):
         self.assert_no_entire_match(r1)
 
     def test_multiple_seq_expansions(self):
-        r1 = generate_rule(Seq("hello", Dict()))
+        r1 = generate_rule(self.hello_dictation)
         self.assert_no_entire_match(r1)
         self.assertTrue(r1.matches("hello"))
         r1.set_next()
@@ -269,7 +350,7 @@ class SequenceRuleEntireMatchProperty(unittest.TestCase):
         self.assert_no_entire_match(r1)
 
     def test_restart_sequence(self):
-        r1 = PublicSequenceRule("test1", Seq("hello", Dict()))
+        r1 = PublicSequenceRule("test1", self.hello_dictation)
         self.assert_no_entire_match(r1)
         self.assertTrue(r1.matches("hello"))
         r1.set_next()
@@ -286,8 +367,8 @@ class SequenceRuleEntireMatchProperty(unittest.TestCase):
         self.assertEqual(r1.entire_match, "hello")
         self.assertTrue(r2.matches(r1.entire_match))
 
-        r3 = PublicSequenceRule("test3", Seq("hello", Dict()))
-        r4 = PublicRule("test4", Seq("hello", Dict()))
+        r3 = PublicSequenceRule("test3", self.hello_dictation)
+        r4 = PublicRule("test4", self.hello_dictation.copy())
         self.assert_no_entire_match(r3)
         self.assertTrue(r3.matches("hello"))
         r3.set_next()
@@ -315,6 +396,23 @@ class SequenceRuleEntireMatchProperty(unittest.TestCase):
         self.assertTrue(r2.matches(r1.entire_match))
 
 
+def match_sequence(rule, speech_list):
+    """
+    Match each of a sequence rule's expansions against the corresponding speech
+    string in a list, stopping at the first failed match.
+
+    :param rule: SequenceRule
+    :param speech_list: list
+    :returns: bool
+    """
+    advance = rule.advance
+    for speech in speech_list:
+        if not advance(speech):
+            return False
+
+    return rule.entire_match is not None
+
+
 class SequenceRuleMatchCase(unittest.TestCase):
     """
     Test the match functionality of the SequenceRule class using expansions
@@ -323,23 +421,29 @@ class SequenceRuleMatchCase(unittest.TestCase):
 
     def assert_rule_matches_speech(self, expansion, speech_list):
         r = SequenceRule("test", True, expansion)
-        i = 0
-        while r.has_next_expansion:
-            self.assertTrue(r.matches(speech_list[i]))
-            r.set_next()  # go to the next expansion
-            i += 1
+        self.assertTrue(match_sequence(r, speech_list))
 
     def assert_rule_does_not_match_speech(self, expansion, speech_list):
         r = SequenceRule("test", True, expansion)
-        i = 0
-        final_result = r.matches(speech_list[i])
-        while r.has_next_expansion:
-            final_result = final_result and r.matches(speech_list[i])
-            if not final_result:
-                break
-            i += 1
-
-        self.assertFalse(final_result)
+        self.assertFalse(match_sequence(r, speech_list))
+
+    def test_advance(self):
+        r = SequenceRule("test", True, Seq("hello", Dict(), "world"))
+        self.assertTrue(r.advance("hello"))
+        self.assertEqual(r.expansion, r.expansion_sequence[1])
+        self.assertTrue(r.advance("there"))
+        self.assertEqual(r.expansion, r.expansion_sequence[2])
+
+        # Failed matches don't move to the next expansion.
+        self.assertFalse(r.advance("planet"))
+        self.assertEqual(r.expansion, r.expansion_sequence[2])
+        r.refuse_matches = False
+        self.assertTrue(r.advance("world"))
+        self.assertFalse(r.has_next_expansion)
+        self.assertEqual(r.entire_match, "hello there world")
+
+        # There are no more expansions to match.
+        self.assertFalse(r.advance("world"))
 
     def test_only_dictation_match(self):
         self.assert_rule_matches_speech(Dict(), ["hello"])
@@ -361,18 +465,13 @@ class SequenceRuleMatchCase(unittest.TestCase):
                                         ("test testing", "hello"))
 
     def test_multiple_dictation_in_sequence(self):
-        e1 = Seq(Dict(), "test", "testing", Dict())
+        e1, e2, e3 = multiple_dictation_sequences()
         self.assert_rule_matches_speech(e1,
                                         ("hello", "test testing",
                                          "world"))
-
-        e2 = Seq("test", Dict(), "testing", Dict())
         self.assert_rule_matches_speech(e2,
                                         ("test", "hello", "testing",
                                          "world"))
-
-        e3 = Seq("test", "testing", Dict(),
-                 "more", "testing", Dict())
         self.assert_rule_matches_speech(e3,
                                         ("test testing", "hello",
                                          "more testing", "world"))
@@ -392,8 +491,12 @@ class SequenceRuleRefuseMatches(unittest.TestCase):
         self.r3 = generate_rule(Seq("test", Dict()))
         self.rules = [self.r1, self.r2, self.r3]
 
+        # Keep a copy of each compiled rule
+        self.compiled = ["public <%s> = %s;" % (r.name, r.expansion.compile())
+                         for r in self.rules]
+
     def test_initial_values(self):
-        for r in self.rules:
+        for r, compiled in zip(self.rules, self.compiled):
             self.assertFalse(
                 r.refuse_matches, "refuse_matches should initially be False")
 
@@ -401,7 +504,7 @@ class SequenceRuleRefuseMatches(unittest.TestCase):
             if r.current_is_dictation_only:
                 expected = ""
             else:
-                expected = "public <%s> = %s;" % (r.name, r.expansion.compile())
+                expected = compiled
 
             self.assertEqual(r.compile(), expected)
 
@@ -418,9 +521,7 @@ class SequenceRuleRefuseMatches(unittest.TestCase):
 
     def test_one_expansion(self):
         r1, r2 = self.r1, self.r2
-
-        # Keep a copy of the compiled rule
-        r1_compiled = "public <%s> = %s;" % (r1.name, r1.expansion.compile())
+        r1_compiled = self.compiled[0]
 
         # Test matching
         self.assertTrue(r1.matches("test"))
@@ -478,9 +579,7 @@ class SequenceRuleRefuseMatches(unittest.TestCase):
 
     def test_multiple_expansions(self):
         r3 = self.r3
-
-        # Keep a copy of the compiled rule
-        r3_compiled = "public <%s> = %s;" % (r3.name, r3.expansion.compile())
+        r3_compiled = self.compiled[2]
 
         # Test matching
         self.assertTrue(r3.matches("test"))
@@ -540,12 +639,7 @@ class SequenceRuleRefuseMatches(unittest.TestCase):
 class SequenceRuleCompileCase(unittest.TestCase):
     def assert_compiled_rules_equal(self, expansion, expected):
         rule = HiddenSequenceRule("test", expansion)
-        compiled_rules = [rule.compile()]
-        while rule.has_next_expansion:
-            rule.set_next()
-            compiled_rules.append(rule.compile())
-
-        self.assertListEqual(compiled_rules, list(expected))
+        self.assertEqual(rule.compile_sequence(), tuple(expected))
 
     def test_only_dictation_compile(self):
         self.assert_compiled_rules_equal(Dict(), [""])
@@ -583,23 +677,18 @@ class SequenceRuleCompileCase(unittest.TestCase):
         ))
 
     def test_multiple_dictation_in_sequence(self):
-        e1 = Seq(Dict(), "test", "testing", Dict())
+        e1, e2, e3 = multiple_dictation_sequences()
         self.assert_compiled_rules_equal(e1, (
             "",
             "<test> = test testing;",
             ""
         ))
-
-        e2 = Seq("test", Dict(), "testing", Dict())
         self.assert_compiled_rules_equal(e2, (
             "<test> = test;",
             "",
             "<test> = testing;",
             ""
         ))
-
-        e3 = Seq("test", "testing", Dict(),
-                 "more", "testing", Dict())
         self.assert_compiled_rules_equal(e3, (
             "<test> = test testing;",
             "",
@@ -607,6 +696,39 @@ class SequenceRuleCompileCase(unittest.TestCase):
             ""
         ))
 
+    def test_compile_sequence_state(self):
+        # compile_sequence() shouldn't change the current expansion or whether
+        # matches are refused.
+        rule = HiddenSequenceRule("test", multiple_dictation_sequences()[1])
+        rule.set_next()
+        rule.refuse_matches = True
+        self.assertEqual(rule.compile_sequence(), (
+            "<test> = test;", "", "<test> = testing;", ""
+        ))
+        self.assertIs(rule.expansion, rule.expansion_sequence[1])
+        self.assertTrue(rule.refuse_matches)
+
+    def test_compile_after_restart(self):
+        # Compiled sequence expansions are reused between passes through the
+        # sequence, but changes to the rule itself should still be reflected.
+        rule = HiddenSequenceRule("test", multiple_dictation_sequences()[1])
+
+        def compile_sequence():
+            rule.restart_sequence()
+            compiled_rules = [rule.compile()]
+            while rule.has_next_expansion:
+                rule.set_next()
+                compiled_rules.append(rule.compile())
+            return compiled_rules
+
+        expected = ["<test> = test;", "", "<test> = testing;", ""]
+        self.assertListEqual(compile_sequence(), expected)
+        self.assertListEqual(compile_sequence(), expected)
+        rule.name = "renamed"
+        self.assertListEqual(compile_sequence(), [
+            "<renamed> = test;", "", "<renamed> = testing;", ""
+        ])
+
     def test_dictation_in_alternative_set(self):
         e1 = Seq(AS(Dict(), "test", "testing"), "end")
         self.assertRaises(GrammarError, generate_rule, e1)
@@ -636,25 +758,25 @@ class ComparisonTests(unittest.TestCase):
         self.assertEqual(value, h(r))
 
         # Rules with only a different type should generate the same hash value
-        self.assertEqual(h(PublicSequenceRule("a", e.copy())),
-                         h(SequenceRule("a", True, e.copy())))
+        self.assertEqual(h(PublicSequenceRule("a", e)),
+                         h(SequenceRule("a", True, e)))
 
         # Rules that are different should generate different values
-        self.assertNotEqual(h(PublicSequenceRule("a", e.copy())),
-                            h(HiddenSequenceRule("a", e.copy())))
-        self.assertNotEqual(h(PublicSequenceRule("a", e.copy())),
-                            h(SequenceRule("a", False, e.copy())))
-        self.assertNotEqual(h(PublicSequenceRule("a", e.copy())),
-                            h(PublicSequenceRule("b", e.copy())))
-        self.assertNotEqual(h(PublicSequenceRule("a", e.copy())),
-                            h(PublicSequenceRule("a", f.copy())))
-        self.assertNotEqual(h(PublicSequenceRule("a", e.copy())),
-                            h(PublicSequenceRule("b", f.copy())))
+        self.assertNotEqual(h(PublicSequenceRule("a", e)),
+                            h(HiddenSequenceRule("a", e)))
+        self.assertNotEqual(h(PublicSequenceRule("a", e)),
+                            h(SequenceRule("a", False, e)))
+        self.assertNotEqual(h(PublicSequenceRule("a", e)),
+                            h(PublicSequenceRule("b", e)))
+        self.assertNotEqual(h(PublicSequenceRule("a", e)),
+                            h(PublicSequenceRule("a", f)))
+        self.assertNotEqual(h(PublicSequenceRule("a", e)),
+                            h(PublicSequenceRule("b", f)))
 
         # Test that a normal Rule with the same expansion generates the same
         # hash as a SequenceRule.
-        self.assertEqual(h(PublicRule("b", f.copy())),
-                         h(PublicSequenceRule("b", f.copy())))
+        self.assertEqual(h(PublicRule("b", f)),
+                         h(PublicSequenceRule("b", f)))
 
 
 if __name__ == '__main__':
@@ -4,6 +4,18 @@ from jsgf import *
 from mock import patch
 
 
+def choose_indices(*indices):
+    """
+    Return a replacement for random.choice that picks list items using each
+    index in turn.
+    """
+    indices = list(indices)
+
+    def choice(lst):
+        return lst[indices.pop(0)]
+    return choice
+
+
 class RuleGenerators(unittest.TestCase):
     
     def test_rule(self):
@@ -23,16 +35,10 @@ class ExpansionGenerators(unittest.TestCase):
         self.assertEqual(e.generate(), "hello world")
         
     def test_alt_set(self):
-        i = 0
-        
-        def choice(lst):
-            return lst[i]
-        
         hello, hi = map(Literal, ["hello", "hi"])
         e = AlternativeSet(hello, hi)
-        with patch("random.choice", choice):
+        with patch("random.choice", choose_indices(0, 1)):
             self.assertEqual(e.generate(), "hello")
-            i += 1
             self.assertEqual(e.generate(), "hi")
     
     def test_rule_ref(self):
@@ -42,17 +48,16 @@ class ExpansionGenerators(unittest.TestCase):
         self.assertEqual(e2.generate(), "hi bob")
         
     def test_optional(self):
-        i = 0
-    
-        def choice(lst):
-            return lst[i]
-    
         e = Sequence("hello", OptionalGrouping("there"))
-        with patch("random.choice", choice):
+        with patch("random.choice", choose_indices(0, 1, 1)):
             self.assertEqual(e.generate(), "hello there")
-            i += 1
             self.assertEqual(e.generate(), "hello")
 
+            # The child shouldn't be generated if it isn't chosen.
+            with patch.object(Literal, "generate") as mocked_generate:
+                self.assertEqual(OptionalGrouping("there").generate(), "")
+                self.assertFalse(mocked_generate.called)
+
     def test_repeat(self):
         e = Repeat("hello")
         with patch("random.random", return_value=0) as mocked_random:
@@ -61,15 +66,9 @@ class ExpansionGenerators(unittest.TestCase):
             mocked_random.return_value = .12345
             self.assertEqual(e.generate(), "hello hello hello hello")
 
-        indices = [1, 0, 1, 0, 1]  # for five choices
-        
-        def choice(lst):
-            i = indices.pop(0)
-            return lst[i]
-
         e = Repeat(AlternativeSet("hello", "hi"))
         with patch("random.random", return_value=0) as mocked_random:
-            with patch("random.choice", choice):
+            with patch("random.choice", choose_indices(1, 0, 1, 0, 1)):
                 mocked_random.return_value = .5
                 self.assertEqual(e.generate(), "hi hello")
                 mocked_random.return_value = .25
@@ -85,15 +84,9 @@ class ExpansionGenerators(unittest.TestCase):
             mocked_random.return_value = .786
             self.assertEqual(e.generate(), "")
 
-        indices = [1, 0, 1]  # for three choices
-
-        def choice(lst):
-            i = indices.pop(0)
-            return lst[i]
-
         e = KleeneStar(AlternativeSet("hello", "hi"))
         with patch("random.random", return_value=0) as mocked_random:
-            with patch("random.choice", choice):
+            with patch("random.choice", choose_indices(1, 0, 1)):
                 mocked_random.return_value = .5
                 self.assertEqual(e.generate(), "hi")
                 mocked_random.return_value = .25
@@ -2,14 +2,24 @@
 # The above line is required for the MultiLingualTests class
 
 import copy
+import pickle
 import tempfile
 import unittest
 
+from six import StringIO
+
 from jsgf import *
 from jsgf.ext import Dictation
 
 
 class BasicGrammarCase(unittest.TestCase):
+    # Expected compile output for the grammar built in setUp.
+    expected_compiled = "#JSGF V1.0;\n" \
+                        "grammar test;\n" \
+                        "public <greet> = (<greetWord> <name>);\n" \
+                        "<greetWord> = hello|hi;\n" \
+                        "<name> = peter|john|mary|anna;\n"
+
     def setUp(self):
         rule2 = PrivateRule("greetWord", AlternativeSet("hello", "hi"))
         rule3 = PrivateRule("name", AlternativeSet(
@@ -23,22 +33,10 @@ class BasicGrammarCase(unittest.TestCase):
         self.rule3 = rule3
 
     def test_compile(self):
-        expected = "#JSGF V1.0;\n" \
-                   "grammar test;\n" \
-                   "public <greet> = (<greetWord> <name>);\n" \
-                   "<greetWord> = hello|hi;\n" \
-                   "<name> = peter|john|mary|anna;\n"
-
         compiled = self.grammar.compile()
-        self.assertEqual(expected, compiled)
+        self.assertEqual(self.expected_compiled, compiled)
 
     def test_compile_to_file(self):
-        expected = "#JSGF V1.0;\n" \
-                   "grammar test;\n" \
-                   "public <greet> = (<greetWord> <name>);\n" \
-                   "<greetWord> = hello|hi;\n" \
-                   "<name> = peter|john|mary|anna;\n"
-
         # Create a temporary testing file.
         tf = tempfile.NamedTemporaryFile()
         self.grammar.compile_to_file(tf.name)
@@ -48,7 +46,7 @@ class BasicGrammarCase(unittest.TestCase):
             content = f.read()
 
         try:
-            self.assertEqual(expected, content)
+            self.assertEqual(self.expected_compiled, content)
         finally:
             # Always close and remove the temp file, even if the assertion fails.
             tf.close()
@@ -76,6 +74,18 @@ class BasicGrammarCase(unittest.TestCase):
         self.assertIsNone(self.grammar.remove_rule(self.rule2,
                                                    ignore_dependent=True))
 
+    def test_remove_rule_objects(self):
+        # Rules that aren't in the grammar cannot be removed.
+        self.assertRaises(GrammarError, self.grammar.remove_rule,
+                          PrivateRule("other", "bob"))
+        self.assertRaises(GrammarError, self.grammar.remove_rule,
+                          PrivateRule("name", "bob"))
+
+        # Rules comparable to one in the grammar can be.
+        self.grammar.remove_rule(PublicRule("greet", RequiredGrouping(
+            RuleRef(self.rule2), RuleRef(self.rule3))))
+        self.assertListEqual([self.rule2, self.rule3], self.grammar.rules)
+
     def test_add_rules_with_taken_names(self):
         self.assertRaises(GrammarError, self.grammar.add_rule,
                           PublicRule("name", "bob"))
@@ -87,6 +97,83 @@ class BasicGrammarCase(unittest.TestCase):
                         PublicRule("name", "bob")]
         self.assertRaises(GrammarError, self.grammar.add_rules, *rules_to_add)
 
+    def test_pickling(self):
+        # Test that grammars, rules and expansions can be pickled and matched
+        # afterwards with each protocol.
+        expected = self.grammar.compile()
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            grammar = pickle.loads(pickle.dumps(self.grammar, protocol))
+            self.assertEqual(grammar.compile(), expected)
+            self.assertEqual(grammar.find_matching_rules("hello mary"),
+                             [self.rule1])
+
+    def test_renamed_rules(self):
+        # Test that rules can be found and added using names after a rule is
+        # renamed.
+        self.rule3.name = "person"
+        self.assertIs(self.grammar.get_rule_from_name("person"), self.rule3)
+        self.assertRaises(GrammarError, self.grammar.get_rule_from_name, "name")
+        self.assertRaises(GrammarError, self.grammar.add_rule,
+                          PublicRule("person", "bob"))
+        rule4 = PublicRule("name", "bob")
+        self.grammar.add_rule(rule4)
+        self.assertIs(self.grammar.get_rule_from_name("name"), rule4)
+
+        # Test that names are found again after removing a rule.
+        self.grammar.remove_rule(rule4)
+        self.assertRaises(GrammarError, self.grammar.get_rule_from_name, "name")
+        self.assertIs(self.grammar.get_rule_from_name("person"), self.rule3)
+
+    def test_renamed_rules_in_copies(self):
+        # Test that renaming a rule in a copied grammar is picked up by both
+        # grammars, as they share their rules.
+        g = copy.copy(self.grammar)
+        self.rule3.name = "person"
+        self.assertIs(g.get_rule_from_name("person"), self.rule3)
+        self.assertIs(self.grammar.get_rule_from_name("person"), self.rule3)
+        self.assertRaises(GrammarError, g.add_rule, PublicRule("person", "bob"))
+
+    def test_rule_index_kept_on_miss(self):
+        # Test that looking up names not in the grammar doesn't rebuild the rule
+        # name index, and that renaming a rule still does.
+        g = self.grammar
+        self.assertIs(g.get_rule_from_name("greetWord"), self.rule2)
+        index = g._rule_index
+        self.assertRaises(GrammarError, g.get_rule_from_name, "missing")
+        self.assertIs(g._rule_index, index)
+        self.rule2.name = "missing"
+        self.assertIs(g.get_rule_from_name("missing"), self.rule2)
+        self.assertIsNot(g._rule_index, index)
+
+    def test_add_rule_to_copy(self):
+        # Test that rules added through a copy of a grammar can be found through
+        # the original grammar, which shares its rule list.
+        g = Grammar()
+        x = PublicRule("x", "hi")
+        g.add_rule(x)
+        self.assertIs(g.get_rule_from_name("x"), x)
+        g2 = copy.copy(g)
+        y = PublicRule("y", "yo")
+        g2.add_rule(y)
+        self.assertListEqual(g.rule_names, ["x", "y"])
+        self.assertIs(g.get_rule_from_name("y"), y)
+        self.assertRaises(GrammarError, g.add_rule, PublicRule("y", "bob"))
+
+    def test_remove_and_add_rule_in_copy(self):
+        # Test that removing a rule and then adding another through a copy of a
+        # grammar is picked up by the original grammar.
+        g = Grammar()
+        x = PublicRule("x", "hi")
+        g.add_rule(x)
+        self.assertIs(g.get_rule_from_name("x"), x)
+        g2 = copy.copy(g)
+        g2.remove_rule(x)
+        g2.add_rule(PublicRule("z", "yo"))
+        self.assertRaises(GrammarError, g.get_rule_from_name, "x")
+        x2 = PublicRule("x", "bob")
+        g.add_rule(x2)
+        self.assertIs(g2.get_rule_from_name("x"), x2)
+
     def test_enable_disable_rule(self):
         self.grammar.disable_rule(self.rule1)
         self.assertFalse(self.rule1.active)
@@ -125,11 +212,7 @@ class BasicGrammarCase(unittest.TestCase):
         self.assertTrue(self.rule2.active, "rule in grammar should be enabled")
 
     def test_enable_disable_compile_output(self):
-        enabled_output = "#JSGF V1.0;\n" \
-                         "grammar test;\n" \
-                         "public <greet> = (<greetWord> <name>);\n" \
-                         "<greetWord> = hello|hi;\n" \
-                         "<name> = peter|john|mary|anna;\n"
+        enabled_output = self.expected_compiled
 
         self.assertEqual(self.grammar.compile(), enabled_output)
 
@@ -167,6 +250,21 @@ class BasicGrammarCase(unittest.TestCase):
         self.assertEqual(g2, g2, "the same grammar should be equal with itself")
         self.assertEqual(g2, copy.copy(g2),
                          "grammars with the same rules should be equal")
+        g2_copy = copy.copy(g2)
+        self.assertIsInstance(g2_copy, Grammar)
+        self.assertIs(g2_copy.get_rule("r1"), g2.get_rule("r1"))
+
+        # Rules added through the copy are found through the original grammar too.
+        r2 = PublicRule("r2", "world")
+        g2_copy.add_rule(r2)
+        self.assertIs(g2.get_rule("r2"), r2)
+        self.assertEqual(g2, g2_copy)
+        g2_copy.remove_rule(r2)
+        self.assertRaises(GrammarError, g2.get_rule, "r2")
+        root_copy = copy.copy(RootGrammar(g2.rules, name="test"))
+        self.assertIsInstance(root_copy, RootGrammar)
+        self.assertEqual(root_copy.compile(),
+                         RootGrammar(g2.rules, name="test").compile())
 
         self.assertNotEqual(g2, g3, "grammars with only different rules should not "
                                     "be equal")
@@ -400,6 +498,11 @@ class TagTests(unittest.TestCase):
         self.assertRaises(GrammarError, g.get_rules, "W")
         self.assertRaises(GrammarError, g.get_rules, "X", "W")
 
+        # Test that invalid reference names and non-strings are still rejected.
+        self.assertRaises(GrammarError, g.get_rule_from_name, "X Y")
+        self.assertRaises(GrammarError, g.get_rule_from_name, "NULL")
+        self.assertRaises(TypeError, g.get_rule_from_name, x)
+
 
 class SpeechMatchCase(unittest.TestCase):
     def assert_matches(self, speech, rule):
@@ -511,6 +614,14 @@ class VisibleRulesCase(unittest.TestCase):
 
 
 class RootGrammarCase(unittest.TestCase):
+    # Expected compile output for the grammar built in setUp.
+    expected_compiled = "#JSGF V1.0;\n" \
+                        "grammar root;\n" \
+                        "public <root> = <greet>;\n" \
+                        "<greet> = (<greetWord> <name>);\n" \
+                        "<greetWord> = hello|hi;\n" \
+                        "<name> = peter|john|mary|anna;\n"
+
     def setUp(self):
         self.grammar = RootGrammar(name="root")
         self.rule2 = PrivateRule("greetWord", AlternativeSet("hello", "hi"))
@@ -527,37 +638,14 @@ class RootGrammarCase(unittest.TestCase):
 
     def test_compile(self):
         root = self.grammar
-        expected = "#JSGF V1.0;\n" \
-                   "grammar root;\n" \
-                   "public <root> = <greet>;\n" \
-                   "<greet> = (<greetWord> <name>);\n" \
-                   "<greetWord> = hello|hi;\n" \
-                   "<name> = peter|john|mary|anna;\n"
-
-        self.assertEqual(root.compile(), expected)
+        self.assertEqual(root.compile(), self.expected_compiled)
 
     def test_compile_to_file(self):
         root = self.grammar
-        expected = "#JSGF V1.0;\n" \
-                   "grammar root;\n" \
-                   "public <root> = <greet>;\n" \
-                   "<greet> = (<greetWord> <name>);\n" \
-                   "<greetWord> = hello|hi;\n" \
-                   "<name> = peter|john|mary|anna;\n"
-
-        # Create a temporary testing file.
-        tf = tempfile.NamedTemporaryFile()
-        root.compile_to_file(tf.name)
-
-        # Check the file contents after writing to it.
-        with open(tf.name) as f:
-            content = f.read()
-
-        try:
-            self.assertEqual(expected, content)
-        finally:
-            # Always close and remove the temp file, even if the assertion fails.
-            tf.close()
+        # Compile to a file-like object and check what was written to it.
+        f = StringIO()
+        root.compile_to_file(f)
+        self.assertEqual(self.expected_compiled, f.getvalue())
 
     def test_compile_add_remove_rule(self):
         root = RootGrammar(rules=[self.rule5, self.rule4], name="root")
@@ -645,6 +733,9 @@ class RootGrammarCase(unittest.TestCase):
         self.assertListEqual(g.rules, [r])
         g.add_rule(PublicRule("test", "test"))
         self.assertListEqual(g.rules, [r])
+        g.add_rules(*[PublicRule("test", "test") for _ in range(3)])
+        self.assertListEqual(g.rules, [r])
+        self.assertIs(g.get_rule("test"), r)
 
         # Try with slightly different rules
         self.assertRaises(GrammarError, RootGrammar,
@@ -696,12 +787,7 @@ class RootGrammarCase(unittest.TestCase):
         self.assertTrue(self.rule2.active, "original rule should be enabled")
 
     def test_enable_disable_compile_output(self):
-        enabled_output = "#JSGF V1.0;\n" \
-                         "grammar root;\n" \
-                         "public <root> = <greet>;\n" \
-                         "<greet> = (<greetWord> <name>);\n" \
-                         "<greetWord> = hello|hi;\n" \
-                         "<name> = peter|john|mary|anna;\n"
+        enabled_output = self.expected_compiled
 
         self.assertEqual(self.grammar.compile(), enabled_output)
 
@@ -114,6 +114,37 @@ class MatchesCase(unittest.TestCase):
         self.assertEqual(e.children[1].current_match, "world")
         self.assertEqual(e.children[1].matching_slice, slice(6, 11))
 
+    def test_extra_whitespace(self):
+        """Extra whitespace in speech and Literal text is ignored."""
+        # Matching slices and find_matching_part() results refer to the speech
+        # string with one space between words: "hello big world".
+        e = Sequence("hello", "big  world")
+        r = PublicRule("test", e)
+        self.assertTrue(r.matches("  hello \t big   world "))
+        self.assertEqual(e.current_match, "hello big world")
+        self.assertEqual(e.children[0].matching_slice, slice(0, 5))
+        self.assertEqual(e.children[1].current_match, "big world")
+        self.assertEqual(e.children[1].matching_slice, slice(6, 15))
+        self.assertEqual(r.find_matching_part("say hello  big world"),
+                         "hello big world")
+
+    def test_match_after_changes(self):
+        """Changes to the expansion tree are used when matching again."""
+        e = Sequence("hello")
+        r = PublicRule("test", e)
+        self.assertTrue(r.matches("hello"))
+        e.children.append(AlternativeSet("world", "there"))
+        self.assertFalse(r.matches("hello"))
+        self.assertTrue(r.matches("hello there"))
+        self.assertEqual(e.children[1].current_match, "there")
+        self.assertEqual(e.children[1].children[1].current_match, "there")
+        self.assertIsNone(e.children[1].children[0].current_match)
+
+        # Check again with a replaced child.
+        e.children[1] = "world"
+        self.assertTrue(r.matches("hello world"))
+        self.assertEqual(e.children[1].current_match, "world")
+
     def test_sequence_no_match(self):
         e = Sequence("hello", "world")
         r = PublicRule("test", e)
@@ -208,6 +239,22 @@ class MatchesCase(unittest.TestCase):
         self.assertTrue(r.matches("up one down left two right three"))
         self.assertTrue(r.matches("down right three up two left ten"))
 
+    def test_alt_set_longest_literal(self):
+        """The longest matching literal alternative is matched."""
+        test, testing, tes = map(Literal, ["test", "testing", "tes"])
+        e = AlternativeSet(test, testing, tes)
+        r = PublicRule("test", e)
+        self.assertTrue(r.matches("testing"))
+        self.assertEqual(testing.current_match, "testing")
+        self.assertIsNone(test.current_match)
+        self.assertIsNone(tes.current_match)
+
+        self.assertTrue(r.matches("test"))
+        self.assertEqual(test.current_match, "test")
+        self.assertIsNone(testing.current_match)
+        self.assertIsNone(tes.current_match)
+        self.assertFalse(r.matches("te"))
+
     def test_alt_set_weights(self):
         # Test that AlternativeSet weights effects the matching process.
         one, two, three = map(Literal, ["one", "two", "three"])
@@ -663,6 +710,35 @@ class MatchesCase(unittest.TestCase):
         # Test with get_expansion_matches an expansion that isn't a descendant
         self.assertListEqual(e.get_expansion_matches(Literal("d")), [])
 
+    def test_reset_for_new_match(self):
+        # Test that match data is reset properly after matching, including after
+        # the expansion becomes optional.
+        e = Sequence("a", AlternativeSet("b", NullRef()))
+        r = PublicRule("test", e)
+        self.assertTrue(r.matches("a b"))
+        e.reset_for_new_match()
+        self.assertIsNone(e.current_match)
+        self.assertIsNone(e.children[0].current_match)
+        self.assertEqual(e.children[1].children[1].current_match, "")
+        self.assertIsNone(e.children[0].matching_slice)
+
+        r.expansion = OptionalGrouping(e)
+        self.assertTrue(r.matches("a b"))
+        e.reset_for_new_match()
+        self.assertEqual(e.current_match, "")
+        self.assertEqual(e.children[0].current_match, "")
+
+    def test_repetition_equal_expansions(self):
+        # Test that equal expansions under a repeat have separate match values.
+        alt1, alt2 = AlternativeSet("a", "b"), AlternativeSet("a", "b")
+        e = Repeat(Sequence(alt1, alt2))
+        self.assertEqual(e.matches("a b b a"), "")
+        self.assertEqual(e.repetitions_matched, 2)
+        self.assertListEqual(e.get_expansion_matches(alt1), ["a", "b"])
+        self.assertListEqual(e.get_expansion_matches(alt2), ["b", "a"])
+        self.assertListEqual(e.get_expansion_slices(alt2),
+                             [slice(2, 3), slice(6, 7)])
+
     def test_forward_searching_complex(self):
         e = Sequence("a", Sequence(
             OptionalGrouping("b"), OptionalGrouping("c"),
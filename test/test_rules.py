@@ -225,6 +225,16 @@ class InvalidRules(unittest.TestCase):
         self.assertEqual(PublicRule("test", Dictation()).compile(),
                          "public <test> = <DICTATION>;")
 
+    def test_invalid_names(self):
+        # Test that names are validated for each class, including names that
+        # have already been validated.
+        for _ in range(2):
+            self.assertRaises(GrammarError, PublicRule, "NULL", "test")
+            self.assertRaises(GrammarError, PublicRule, "a.b", "test")
+            self.assertRaises(GrammarError, PublicRule, "a b", "test")
+            self.assertEqual(NullRef().name, "NULL")
+            self.assertEqual(NamedRuleRef("a.b").name, "a.b")
+
 
 class ComparisonTests(unittest.TestCase):
     def test_same_type(self):
@@ -370,6 +380,34 @@ class TagTests(unittest.TestCase):
         r.matches("a b")
         self.assertListEqual(r.matched_tags, ["letter", "letter", "alt_set"])
 
+    def test_tags_after_changes(self):
+        # Tags should be up to date after tags or the expansion tree change.
+        n = Rule("n", False, AlternativeSet("one", "two"))
+        r = PublicRule("r", Sequence("hello", "world"))
+        self.assertListEqual(r.tags, [])
+        r.expansion.children[0].tag = "greet"
+        self.assertListEqual(r.tags, ["greet"])
+        self.assertTrue(r.has_tag("greet"))
+        r.expansion.children[0].tag = None
+        self.assertFalse(r.has_tag("greet"))
+        again = Literal("again")
+        again.tag = "repeat"
+        r.expansion.children.append(again)
+        self.assertListEqual(r.tags, ["repeat"])
+
+        # Test that changes to referenced rules are also picked up.
+        r.expansion.children.append(RuleRef(n))
+        self.assertFalse(r.has_tag("number"))
+        n.expansion.tag = "number"
+        self.assertListEqual(r.tags, ["repeat", "number"])
+
+        # The reference check is stored so that the tree is only scanned once.
+        e = r.expansion
+        self.assertIs(e._lookup_calculation("references_in_expansion", e), True)
+        r.expansion.children.pop()
+        self.assertListEqual(r.tags, ["repeat"])
+        self.assertIs(e._lookup_calculation("references_in_expansion", e), False)
+
     def test_get_tags_matching(self):
         # Test with a simple rule
         e = AlternativeSet("open", "close")